@@ -3,6 +3,8 @@ import pandas as pd
 import streamlit as st
 from time import sleep
 from src.models import ModelManager
+from src.metrics import startMetricsServer
+from src.args import METRICS_PORT
 
 title = "🔄 MapGPT"
 
@@ -10,10 +12,14 @@ st.set_page_config(page_title=title, layout="wide")
     
 st.title(title)
 
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["LANGCHAIN_ENDPOINT"]="https://api.smith.langchain.com"
-os.environ["LANGCHAIN_API_KEY"] = st.secrets.get("LANGCHAIN_API_KEY","")
-os.environ["LANGCHAIN_PROJECT"] = st.secrets.get("LANGCHAIN_PROJECT","")
+# LangSmith tracing is only used when its key is given, the calls are always measured locally (see src/metrics.py)
+if st.secrets.get("LANGCHAIN_API_KEY",""):
+    os.environ["LANGCHAIN_TRACING_V2"] = "true"
+    os.environ["LANGCHAIN_ENDPOINT"]="https://api.smith.langchain.com"
+    os.environ["LANGCHAIN_API_KEY"] = st.secrets.get("LANGCHAIN_API_KEY","")
+    os.environ["LANGCHAIN_PROJECT"] = st.secrets.get("LANGCHAIN_PROJECT","")
+if METRICS_PORT:
+    startMetricsServer(METRICS_PORT)
 
 _ = """openai_api_key = st.sidebar.text_input(
     "OpenAI API Key",
@@ -81,6 +87,9 @@ with main_process:
             if 'Unnamed: 0' in st.session_state.target.columns:
                 st.session_state.target = st.session_state.target.drop(columns='Unnamed: 0')
             
+            if st.session_state.get("agent") is not None:
+                # the speculative table of the previous tables would keep paying for requests in the background
+                st.session_state.agent.cancelSpeculation()
             st.session_state.agent = ModelManager(model_name, 
                                                 openai_api_key, 
                                                 openai_api_base,
@@ -104,9 +113,13 @@ if st.session_state.get("source") is not None and st.session_state.get("target")
         with st.spinner("Mapping Columns..."):
             st.session_state.confirmation =  st.session_state.agent.getConfirmationMessage()  
             st.session_state.stage = 1
+        # the table of the unedited row is generated while the user reviews it
+        st.session_state.agent.startSpeculation()
     if st.session_state.get("confirmation"):
         previous = st.session_state.confirmation["previous"]
         after = st.session_state.confirmation["after"]
+        if st.session_state.agent.plan is not None:
+            st.info("The row has been confirmed before for the same source and target columns, it is loaded from the saved mapping plan.")
         st.subheader("Original Row")
         st.dataframe(previous)
         st.subheader("✏️Transformed Row")
@@ -141,8 +154,30 @@ if st.session_state.get("stage") == 1 and model_name != "finetuned_model":
 
 if st.session_state.get("stage") == -1 and st.session_state.get("table") is not None:   
     st.subheader("Final Table") 
+    snapped_cells = getattr(st.session_state.get("agent"), "snapped_cells", {})
+    if snapped_cells:
+        st.info(f"{sum(snapped_cells.values())} cells have been rewritten as the allowed value of their column: " +
+                ", ".join(f"{col} ({count})" for col, count in snapped_cells.items()))
+    gated_cells = getattr(st.session_state.get("agent"), "gated_cells", {})
+    if gated_cells:
+        st.info(f"{sum(gated_cells.values())} generated cells have been left empty since their source cells are empty: " +
+                ", ".join(f"{col} ({count})" for col, count in gated_cells.items()))
+    corrected_cells = getattr(st.session_state.get("agent"), "corrected_cells", {})
+    if corrected_cells:
+        st.info(f"{sum(corrected_cells.values())} cells of the rows similar to the edited ones have been generated again: " +
+                ", ".join(f"{col} ({count})" for col, count in corrected_cells.items()))
     # st.dataframe(st.session_state.table)
     final_table = st.data_editor(st.session_state.table)
+    # the edited cells are re-applied to the similar rows instead of generating the whole table again
+    if model_name != "finetuned_model" and st.button("Apply Corrections to Similar Rows"):
+        with st.spinner('Corrections are being applied...'):
+            progress_text = "Similar rows are being corrected..."
+            progress_bar = st.progress(0, text=progress_text)
+            data = None
+            for data, percentage in st.session_state.agent.applyCorrections(st.session_state.table, final_table):
+                progress_bar.progress(percentage, text=progress_text)
+            st.session_state.table = data
+            st.rerun()
     st.download_button(
         label="Download Table",
         data=final_table.to_csv().encode('utf-8'),
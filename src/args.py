@@ -1,3 +1,5 @@
+import os
+
 TARGET_COLUMN_THRESHOLD = 20            # it is used to decide for the algorithm used in few shot prompt preparation.
 HIGH_TARGET_COLUMN_MAPPING = 30         # it is used to decide for the example count for CellModel
 
@@ -7,4 +9,119 @@ ROW_MODEL_FEW_SHOT_COUNT_BIG = 3        # sets the number of few shot prompts fo
 ROW_MODEL_PERCENTAGE_BIG = 0.8          # sets the remaining columns percentage after randomly removing them for big tables.
 
 CELL_MODEL_EXAMPLES_COUNT_SMALL = 5     # The number of examples needed for CellModel for small tables 
-CELL_MODEL_EXAMPLES_COUNT_BIG   = 3     # The number of examples needed for CellModel for big tables
\ No newline at end of file
+CELL_MODEL_EXAMPLES_COUNT_BIG   = 3     # The number of examples needed for CellModel for big tables
+
+APPLIER_MAX_WORKERS = 4                 # max number of ApplierModel chunk requests in flight during getTable (1 means serial)
+APPLIER_STREAMING = False               # stream ApplierModel completions for progress only, the rows still land when their chunk is validated
+
+OPENAI_API_BASE = "https://api.openai.com/v1"   # backend of the requests when neither openai_api_base nor OPENAI_API_BASE is set
+CACHE_ENABLED = os.getenv("MAPGPT_CACHE", "1") != "0"     # set MAPGPT_CACHE=0 to bypass the response cache
+CACHE_PATH = os.getenv("MAPGPT_CACHE_PATH", ".mapgpt_cache/responses.sqlite")   # SQLite file of the response cache
+CACHE_MAX_ENTRIES = 10000               # least recently used responses above this count are evicted
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60    # cached responses older than this are ignored and evicted (0 disables expiry)
+
+TOKEN_PACKING = True                    # pack getTable chunks by token budget instead of CELL_LIMIT // column count
+TOKEN_BUDGET_RATIO = 0.8                # share of the context window (and of the completion limit) a single chunk may use
+CHARS_PER_TOKEN = 3                     # used for token estimation when tiktoken is not available
+CELL_OVERHEAD_TOKENS = 3                # quotes, colon and comma around each serialized cell
+DEFAULT_TOKEN_LIMITS = (4096, 4096)     # (context window, max completion tokens) of unknown models
+MODEL_TOKEN_LIMITS = {                  # (context window, max completion tokens) per model
+    "gpt-3.5-turbo":(4096, 4096),
+    "gpt-3.5-turbo-0301":(4096, 4096),
+    "gpt-3.5-turbo-0613":(4096, 4096),
+    "gpt-3.5-turbo-1106":(16385, 4096),
+    "gpt-3.5-turbo-16k":(16385, 16385),
+    "gpt-3.5-turbo-16k-0613":(16385, 16385),
+    "gpt-4":(8192, 8192),
+    "gpt-4-0314":(8192, 8192),
+    "gpt-4-0613":(8192, 8192),
+    "gpt-4-1106-preview":(128000, 4096),
+}
+
+COMPILE_TRANSFORMS = True               # compile the confirmed first row into deterministic column transforms when possible
+COMPILE_MIN_LENGTH = 4                  # confirmed cells shorter than this are left to the LLM since they match source cells by chance
+COMMON_VALUES = ["yes", "no", "y", "n", "true", "false", "none", "null", "n/a", "na", "-"]  # values never compiled
+MAX_AFFIX_LENGTH = 4                    # longest prefix + suffix (or concat separator) a compiled transform may add
+SEPARATORS = [" ", ",", ", ", "-", "/", ";", "|", "_"]  # separators tried for split transforms
+DATE_FORMATS = [                        # date formats tried for date reformatting transforms
+    "%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%m/%d/%Y", "%d.%m.%Y", "%d-%m-%Y", "%m-%d-%Y",
+    "%Y-%m-%d %H:%M:%S", "%d %B %Y", "%B %d, %Y", "%d %b %Y", "%b %d, %Y", "%Y%m%d",
+]
+
+MEMOIZE_VALUES = True                   # transform each distinct value of low-cardinality source columns once and broadcast it
+LOW_CARDINALITY_MAX_VALUES = 50         # max distinct values of a low-cardinality source column
+LOW_CARDINALITY_RATIO = 0.2             # max distinct values per row of a low-cardinality source column
+
+APPLIER_MAX_RETRIES = 3                 # max re-requests of the missing or malformed rows of a chunk
+APPLIER_BACKOFF_SECONDS = 1             # wait before the first re-request, doubled at each retry
+
+CHECKPOINT_ENABLED = True               # save the completed getTable chunks so that an interrupted job can be resumed
+CHECKPOINT_PATH = os.getenv("MAPGPT_CHECKPOINT_PATH", ".mapgpt_cache/checkpoints.sqlite")  # SQLite file of the checkpoints
+
+APPLIER_WIRE_FORMAT = "json"            # format of the tables in the ApplierModel prompts: json, csv, tsv, jsonl, indexed or auto
+WIRE_FORMAT_SAMPLE_ROWS = 20            # rows compared by the "auto" wire format
+
+FINETUNED_BATCH_SIZE = 1                # source rows per fine-tuned model request, more than 1 needs a model trained with ROWS_PER_EXAMPLE > 1
+FINETUNED_BATCH_MODEL = os.getenv("MAPGPT_FINETUNED_BATCH_MODEL", "")  # fine-tuned model trained on batched rows, the fine-tuned model is used if it is empty
+
+RATE_LIMIT_ENABLED = os.getenv("MAPGPT_RATE_LIMIT", "1") != "0"   # set MAPGPT_RATE_LIMIT=0 to send the requests without the shared limiter
+DEFAULT_RATE_LIMITS = (3500, 60000)     # (requests per minute, tokens per minute) of unknown models, 0 means no limit
+MODEL_RATE_LIMITS = {                   # (requests per minute, tokens per minute) per model, shared by every request of the process
+    "gpt-3.5-turbo":(3500, 60000),
+    "gpt-3.5-turbo-16k":(3500, 180000),
+    "gpt-4":(500, 10000),
+    "gpt-4-1106-preview":(500, 150000),
+}
+RATE_LIMIT_OUTPUT_RATIO = 1.0           # completion tokens reserved per prompt token before a request (capped by the completion limit)
+RATE_LIMIT_MAX_RETRIES = 6              # retries of rate limited or failed requests
+RATE_LIMIT_BACKOFF_SECONDS = 1          # first wait of the exponential backoff when there is no Retry-After
+
+BATCH_CHUNK_ROWS = 1000                 # source rows read, transformed and written at a time by the batch runner (src/batch.py)
+BATCH_PLAN_ROWS = 100                   # source rows read to confirm the mapping plan
+
+PLAN_CACHE_ENABLED = os.getenv("MAPGPT_PLANS", "1") != "0"   # set MAPGPT_PLANS=0 to always run the confirmation models
+PLAN_CACHE_PATH = os.getenv("MAPGPT_PLANS_PATH", ".mapgpt_cache/plans")  # folder of the mapping plans (JSON files named by schema fingerprint)
+PLAN_PROFILE = False                    # add the kinds of the column values (number, date, text) to the schema fingerprint
+PLAN_PROFILE_ROWS = 20                  # non-empty values per column used for the kinds
+
+COLUMN_MATCHING = True                  # match the confident target columns locally and ask the RowModel only for the rest
+COLUMN_MATCH_THRESHOLD = 0.5            # min similarity of a locally matched source column
+COLUMN_MATCH_MARGIN = 0.15              # min lead of the best source column over the second best one
+COLUMN_MATCH_WEIGHTS = (1.0, 1.0, 0.5)  # weights of the name, value and value shape similarities
+COLUMN_MATCH_SAMPLE_CELLS = 20          # non-empty cells per column compared by the column matching
+COLUMN_MATCH_NGRAM = 3                  # character n-gram length of the similarity features
+COLUMN_MATCH_FEATURES = 4096            # hashed feature dimensions of the similarity vectors
+
+CATEGORICAL_SNAPPING = False            # rewrite the generated cells of closed-vocabulary target columns which equal an allowed value once normalized
+CATEGORICAL_MAX_VALUES = 20             # max distinct values of a closed-vocabulary target column
+CATEGORICAL_RATIO = 0.5                 # max distinct values per non-empty cell of a closed-vocabulary target column
+
+METRICS_PATH = os.getenv("MAPGPT_METRICS_PATH", "")   # JSON lines file every LLM call is appended to, empty disables it
+METRICS_PORT = int(os.getenv("MAPGPT_METRICS_PORT", "0"))   # port of the /metrics endpoint started by app.py, 0 disables it
+METRICS_HOST = os.getenv("MAPGPT_METRICS_HOST", "127.0.0.1")
+METRICS_MAX_CALLS = 10000               # last calls kept in memory for the /calls export
+METRICS_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)   # seconds of the call and queue wait histograms
+METRICS_TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)  # tokens of the prompt and completion histograms
+DEFAULT_PRICES = (0.001, 0.002)         # (input, output) dollars per 1K tokens of unknown models
+MODEL_PRICES = {                        # (input, output) dollars per 1K tokens per model
+    "gpt-3.5-turbo":(0.0015, 0.002),
+    "gpt-3.5-turbo-1106":(0.001, 0.002),
+    "gpt-3.5-turbo-16k":(0.003, 0.004),
+    "gpt-4":(0.03, 0.06),
+    "gpt-4-1106-preview":(0.01, 0.03),
+    "ft:gpt-3.5-turbo":(0.003, 0.006),
+}
+
+TRACE_PATH = os.getenv("MAPGPT_TRACE_PATH", "")   # trace file of the pipeline spans (.folded for folded stacks, Chrome trace JSON otherwise)
+PROFILE_SPANS = [name for name in os.getenv("MAPGPT_PROFILE", "").split(",") if name]   # spans to be profiled, "*" profiles every stage
+PROFILER = os.getenv("MAPGPT_PROFILER", "cprofile")   # cprofile or pyinstrument
+PROFILE_PATH = os.getenv("MAPGPT_PROFILE_PATH", ".mapgpt_cache/profiles")   # folder of the saved profiles
+TRACE_MAX_SPANS = 100000                # last spans kept for the trace file
+
+SPECULATION = True                      # app.py generates the table with the unedited first row while the user reviews it
+
+CORRECTION_MAX_EXAMPLES = 3             # edited rows added as examples when the corrections of the final table are applied
+CORRECTION_SIMILARITY = 0.7             # min n-gram Jaccard similarity of the source cells of a row to be corrected with an edited row
+
+LINEAGE_PRUNING = True                  # only the source columns feeding the requested target columns are sent to the ApplierModel
+EMPTY_SOURCE_GATE = False               # the generated cells whose verified source cells are all empty are blanked and not requested
@@ -0,0 +1,211 @@
+"""Headless batch runner: transforms a CSV or Excel source of any size into the format of the target table chunk by chunk.
+
+    python -m src.batch --source feed.csv --target template.csv --plan plan.json --confirm_only
+    python -m src.batch --source feed.csv --target template.csv --plan plan.json --output result.parquet
+
+The first command saves the mapping plan (the confirmed first row) to be reviewed and edited, the second one reuses it.
+Without --plan, the plan saved for the same source and target schemas is used (see PlanStore), so the daily files of a
+feed skip the confirmation models.
+Only one chunk of the source is in memory at a time and every finished chunk is appended to the output.
+"""
+import os
+import time
+import hashlib
+import argparse
+import pandas as pd
+from src import args
+from src.models import ModelManager
+from src.cache import getApiBase
+from src.plan import getPlan, savePlan, loadPlan, getSchemaFingerprint, PlanStore
+from src.transforms import columnToString
+
+def isExcel(path):
+    return os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm", ".xls")
+
+def dropIndexColumn(table):
+    if 'Unnamed: 0' in table.columns:
+        table = table.drop(columns='Unnamed: 0')
+    return table
+
+def readExcelChunks(path, chunk_rows):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("Reading Excel files needs openpyxl: pip install openpyxl")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+def readChunks(path, chunk_rows=args.BATCH_CHUNK_ROWS):
+    """Yields the table in DataFrames of chunk_rows rows without reading the whole file.
+    """
+    if isExcel(path):
+        chunks = readExcelChunks(path, chunk_rows)
+    else:
+        chunks = pd.read_csv(path, index_col=False, chunksize=chunk_rows)
+    for chunk in chunks:
+        yield dropIndexColumn(chunk).reset_index(drop=True)
+
+def readTable(path):
+    table = pd.read_excel(path) if isExcel(path) else pd.read_csv(path, index_col=False)
+    return dropIndexColumn(table)
+
+def getSourceGroups(path, chunk_rows=args.BATCH_CHUNK_ROWS):
+    """Identical columns ({kept column: [kept column, duplicate columns...]}) and constant columns of the whole file,
+    read chunk by chunk. A column which is empty or constant only within some chunks is not dropped for them.
+    """
+    fingerprints = {}
+    values = {}
+    rows = 0
+    for chunk in readChunks(path, chunk_rows):
+        for col in chunk.columns:
+            cells = columnToString(chunk[col])
+            fingerprints.setdefault(str(col), hashlib.sha1()).update(("\x1f".join(cells) + "\x1e").encode("utf-8"))
+            distinct_values = values.setdefault(str(col), set())
+            if len(distinct_values) < 2:
+                distinct_values.update(cells.unique()[:2])
+        rows += chunk.shape[0]
+    
+    buckets = {}
+    for col, fingerprint in fingerprints.items():
+        buckets.setdefault(fingerprint.hexdigest(), []).append(col)
+    identical_columns = {cols[0]:cols for cols in buckets.values() if len(cols) > 1}
+    duplicate_columns = {col for cols in identical_columns.values() for col in cols[1:]}
+    constant_columns = [col for col in fingerprints if col not in duplicate_columns and len(values[col]) < 2] if rows > 1 else []
+    return identical_columns, constant_columns
+
+class TableWriter:
+    """Appends the finished chunks to a CSV or Parquet file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.parquet = os.path.splitext(path)[1].lower() == ".parquet"
+        self.writer = None
+        self.rows = 0
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def write(self, table):
+        if self.parquet:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError("Writing Parquet files needs pyarrow: pip install pyarrow")
+            batch = pa.Table.from_pandas(table.astype(str), preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, batch.schema)
+            self.writer.write_table(batch)
+        else:
+            table.to_csv(self.path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        self.rows += table.shape[0]
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def getPlanForSource(source_path, target, model_name, openai_api_key, openai_api_base, plan_path=""):
+    """Returns the mapping plan of the plan file, or the one saved for the schemas of the tables.
+    If there is none, the first row of the source is confirmed with the confirmation models and the plan is saved.
+    """
+    if plan_path and os.path.exists(plan_path):
+        return loadPlan(plan_path)
+    source = next(readChunks(source_path, args.BATCH_PLAN_ROWS))
+    plans = PlanStore() if args.PLAN_CACHE_ENABLED else None
+    plan = plans.get(getSchemaFingerprint(source, target, api_base=getApiBase(openai_api_base))) if plans is not None else None
+    if plan is None:
+        manager = ModelManager(model_name, openai_api_key, openai_api_base, source=source, target=target.copy(), plans=False)
+        manager.getConfirmationMessage()
+        plan = getPlan(manager)
+        if plans is not None:
+            plans.set(plan["fingerprint"], plan)
+    if plan_path:
+        savePlan(plan, plan_path)
+    return plan
+
+def runBatch(source_path, target, output_path, plan, model_name, openai_api_key, openai_api_base,
+             chunk_rows=args.BATCH_CHUNK_ROWS, **manager_kwargs):
+    """Transforms the source chunk by chunk with the plan and appends the results to the output.
+    Yields (finished rows, failed rows) after every chunk.
+    """
+    # the identical and constant columns of a single chunk are not the ones of the whole file
+    source_groups = getSourceGroups(source_path, chunk_rows)
+    writer = TableWriter(output_path)
+    manager = None
+    failed_rows = []
+    rows = 0
+    try:
+        for chunk in readChunks(source_path, chunk_rows):
+            if [str(col) for col in chunk.columns] != plan["source_columns"]:
+                raise ValueError(f"The columns of {source_path} do not match the source columns of the plan")
+            chunk.columns = plan["source_columns"]
+            if manager is None:
+                manager = ModelManager(model_name, openai_api_key, openai_api_base, source=chunk, target=target, plans=False, 
+                                       source_groups=source_groups, **manager_kwargs)
+            else:
+                manager.setTables(chunk, target)
+            # the first source row of the plan is the example row of every chunk
+            manager.applyPlan(plan)
+            table = None
+            for table, _ in manager.getTable():
+                pass
+            writer.write(table)
+            failed_rows.extend(rows + row for row in manager.failed_rows)
+            rows += chunk.shape[0]
+            yield rows, failed_rows
+    finally:
+        writer.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MapGPT batch runner")
+    parser.add_argument("--source", required=True, help="CSV or Excel file to be transformed")
+    parser.add_argument("--target", required=True, help="CSV or Excel file with the target format")
+    parser.add_argument("--plan", default="", help="JSON file of the mapping plan, it is created if it does not exist")
+    parser.add_argument("--output", default="", help="CSV or Parquet file of the result")
+    parser.add_argument("--confirm_only", action="store_true", help="only create the plan so that it can be reviewed")
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", "gpt-3.5-turbo-1106"))
+    parser.add_argument("--chunk_rows", type=int, default=args.BATCH_CHUNK_ROWS)
+    parser.add_argument("--max_workers", type=int, default=args.APPLIER_MAX_WORKERS)
+    parser.add_argument("--wire_format", default=args.APPLIER_WIRE_FORMAT)
+    options = parser.parse_args()
+
+    openai_api_key = os.getenv("OPENAI_API_KEY", "")
+    openai_api_base = os.getenv("OPENAI_API_BASE", "")
+    target = readTable(options.target)
+
+    plan = getPlanForSource(options.source, target, options.model, openai_api_key, openai_api_base, options.plan)
+    if plan["model"] != options.model:
+        print(f"The plan was confirmed with {plan['model']}, it is applied with {options.model}")
+    print(f"Mapping plan {options.plan or plan['fingerprint']}:")
+    print(pd.DataFrame([plan["first_row"]]).to_string(index=False))
+    if options.confirm_only:
+        raise SystemExit(0)
+    if not options.output:
+        parser.error("--output is needed to transform the source")
+
+    start = time.perf_counter()
+    rows, failed_rows = 0, []
+    for rows, failed_rows in runBatch(options.source, target, options.output, plan,
+                                      options.model, openai_api_key, openai_api_base,
+                                      options.chunk_rows,
+                                      max_workers=options.max_workers,
+                                      wire_format=options.wire_format):
+        print(f"{rows} rows done in {time.perf_counter() - start:.1f}s")
+    if failed_rows:
+        print(f"{len(failed_rows)} rows could not be generated and are left empty: {failed_rows[:20]}")
+    print(f"{rows} rows have been written to {options.output}")
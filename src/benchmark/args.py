@@ -0,0 +1,13 @@
+HOST = "127.0.0.1"
+PORT = 0                        # 0 picks a free port
+LATENCY = 0.2                   # seconds before the first token of each response
+TOKENS_PER_SECOND = 200         # generation speed of the fake model (0 means instant)
+ERROR_RATE = 0.0                # probability of answering with 429
+RETRY_AFTER_SECONDS = 1         # Retry-After header of the 429 answers
+STREAM_PIECE_CHARS = 8          # characters per streamed chunk
+SEED = 0
+
+MODEL_NAME = "gpt-3.5-turbo-1106"
+ROW_COUNTS = [10, 100, 1000]    # synthetic source table sizes
+COLUMN_COUNTS = [5, 20, 50]     # synthetic source and target column counts
+TARGET_ROW_COUNT = 10
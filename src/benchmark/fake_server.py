@@ -0,0 +1,231 @@
+"""OpenAI compatible stand-in server to run MapGPT without OpenAI.
+Point openai_api_base (or OPENAI_API_BASE for app.py) to http://host:port/v1.
+
+    python -m src.benchmark.fake_server --port 8000 --latency 0.5 --tokens_per_second 100
+"""
+import ast
+import json
+import time
+import random
+import hashlib
+import argparse
+import pandas as pd
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.benchmark import args
+from src.tokens import countTokens
+from src.wire_formats import WIRE_FORMATS
+
+def literal(text):
+    try:
+        return ast.literal_eval(text.strip())
+    except (SyntaxError, ValueError):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+
+def between(text, start, end):
+    if start not in text:
+        return None
+    text = text.split(start, 1)[1]
+    return text.split(end, 1)[0] if end in text else text
+
+def getFakeCompletion(messages):
+    """Deterministic answer derived from the request. The prompts of the pipeline are recognized so that the answers
+    have the shape the models expect: target column j is filled from source column j (cyclically).
+    """
+    content = "\n".join(message.get("content","") for message in messages)
+
+    # ApplierModel
+    dataframe_json = literal(between(content, "Source2 JSON:\n", "\n####") or "")
+    target_json = literal(between(content, "Target1 JSON:\n", "\n####") or "")
+    if isinstance(dataframe_json, dict) and isinstance(target_json, dict):
+        source_columns = [list(cells.values()) if isinstance(cells, dict) else list(cells) for cells in dataframe_json.values()]
+        row_count = max([len(cells) for cells in source_columns], default=0)
+        res = {}
+        for j, col in enumerate(target_json):
+            cells = source_columns[j % len(source_columns)] if source_columns else []
+            res[col] = [str(cells[i]) if i < len(cells) else "" for i in range(row_count)]
+        return json.dumps(res)
+
+    # ApplierModel with a compact wire format, the answer is written in the format of the prompt
+    dataframe_text = between(content, "Source2 table:\n", "\n####")
+    target_text = between(content, "Target1 table:\n", "\n####")
+    wire_format = next((wire_format for wire_format in WIRE_FORMATS.values() 
+                        if wire_format.description and f"written in {wire_format.description}." in content), None)
+    if dataframe_text is not None and target_text is not None and wire_format is not None:
+        source = wire_format.loadTable(dataframe_text)
+        columns = list(wire_format.loadTable(target_text).columns)
+        res = {}
+        for j, col in enumerate(columns):
+            cells = source.iloc[:, j % source.shape[1]].tolist() if source.shape[1] else [""] * source.shape[0]
+            res[col] = [str(cell) for cell in cells]
+        return wire_format.dumpOutput(pd.DataFrame(res, columns=columns))
+
+    # FinetunedBatchModel
+    examples = literal(between(content, "Examples:\n", "\n") or "")
+    rows = literal(between(content, "Source JSON rows:\n", "\n") or "")
+    if isinstance(examples, dict) and isinstance(rows, dict):
+        res = {}
+        for row_id, source in rows.items():
+            values = [str(v) for v in source.values()] or [""]
+            res[row_id] = {col:values[j % len(values)] for j, col in enumerate(examples)}
+        return json.dumps(res)
+
+    # FinetunedModel
+    examples = literal(between(content, "Examples:\n", "\n") or "")
+    source = literal(between(content, "Source JSON:\n", "\n") or "")
+    if isinstance(examples, dict) and isinstance(source, dict):
+        values = [str(v) for v in source.values()] or [""]
+        return json.dumps({col:values[j % len(values)] for j, col in enumerate(examples)})
+
+    # RowModel
+    columns = literal(between(content, "Columns:", "\n") or "")
+    row = between(content, "Source:  ", "\nJSON:")
+    if isinstance(columns, list) and row is not None:
+        elements = [element.split(" is ", 1)[-1] for element in row.split(", ")]
+        return json.dumps({col:elements[j % len(elements)] for j, col in enumerate(columns)})
+
+    # CellModel and CellModelV2
+    table1 = literal(between(content, "Source JSON:\n", "\n\nRefined JSON:") or
+                     between(content, "Broken JSON:\n", "\n\nRefined JSON:") or "")
+    if isinstance(table1, dict):
+        return json.dumps(table1)
+
+    return json.dumps({"echo":hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]})
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *arguments):
+        pass
+
+    def sendJson(self, status, data, headers={}):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self.sendJson(404, {"error":{"message":f"Unknown path {self.path}", "type":"invalid_request_error"}})
+            return
+
+        model = request.get("model", "gpt-3.5-turbo")
+        messages = request.get("messages", [])
+        prompt_tokens = sum(countTokens(message.get("content",""), model) for message in messages)
+        fake.record(requests=1, prompt_tokens=prompt_tokens)
+
+        time.sleep(fake.latency)
+        if fake.shouldFail():
+            fake.record(errors=1)
+            self.sendJson(429, {"error":{"message":"Rate limit reached (fake server)", "type":"requests"}},
+                          headers={"Retry-After":str(args.RETRY_AFTER_SECONDS)})
+            return
+
+        content = getFakeCompletion(messages)
+        completion_tokens = countTokens(content, model)
+        fake.record(completion_tokens=completion_tokens)
+        response_id = "chatcmpl-" + hashlib.sha256(content.encode("utf-8")).hexdigest()[:24]
+
+        if not request.get("stream"):
+            fake.generate(completion_tokens)
+            self.sendJson(200, {
+                "id":response_id,
+                "object":"chat.completion",
+                "created":int(time.time()),
+                "model":model,
+                "choices":[{"index":0, "message":{"role":"assistant", "content":content}, "finish_reason":"stop"}],
+                "usage":{"prompt_tokens":prompt_tokens,
+                         "completion_tokens":completion_tokens,
+                         "total_tokens":prompt_tokens + completion_tokens}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [content[i:i+args.STREAM_PIECE_CHARS] for i in range(0, len(content), args.STREAM_PIECE_CHARS)]
+        for piece in pieces:
+            fake.generate(completion_tokens / len(pieces))
+            chunk = {"id":response_id,
+                     "object":"chat.completion.chunk",
+                     "created":int(time.time()),
+                     "model":model,
+                     "choices":[{"index":0, "delta":{"content":piece}, "finish_reason":None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+class FakeOpenAIServer:
+    """Runs the stand-in server in a background thread and counts what the pipeline sent to it.
+    """
+    def __init__(self, host=args.HOST, port=args.PORT,
+                 latency=args.LATENCY,
+                 tokens_per_second=args.TOKENS_PER_SECOND,
+                 error_rate=args.ERROR_RATE,
+                 seed=args.SEED):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = None
+        self.reset()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reset(self):
+        with self.lock:
+            self.stats = {"requests":0, "errors":0, "prompt_tokens":0, "completion_tokens":0}
+
+    def record(self, requests=0, prompt_tokens=0, completion_tokens=0, errors=0):
+        with self.lock:
+            self.stats["requests"] += requests
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            self.stats["errors"] += errors
+
+    def shouldFail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def generate(self, tokens):
+        if self.tokens_per_second:
+            time.sleep(tokens / self.tokens_per_second)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI compatible stand-in server")
+    parser.add_argument("--host", default=args.HOST)
+    parser.add_argument("--port", type=int, default=args.PORT)
+    parser.add_argument("--latency", type=float, default=args.LATENCY)
+    parser.add_argument("--tokens_per_second", type=float, default=args.TOKENS_PER_SECOND)
+    parser.add_argument("--error_rate", type=float, default=args.ERROR_RATE)
+    parser.add_argument("--seed", type=int, default=args.SEED)
+    options = parser.parse_args()
+    server = FakeOpenAIServer(options.host, options.port, options.latency,
+                              options.tokens_per_second, options.error_rate, options.seed)
+    print(f"Fake OpenAI server is listening on {server.url}")
+    server.httpd.serve_forever()
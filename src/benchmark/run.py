@@ -0,0 +1,111 @@
+"""End-to-end throughput benchmark of ModelManager against the fake OpenAI server.
+
+    python -m src.benchmark.run --rows 10 100 --columns 5 20 --output bench.jsonl
+"""
+import sys
+import json
+import time
+import resource
+import argparse
+import pandas as pd
+from src.benchmark import args
+from src.args import APPLIER_MAX_WORKERS, APPLIER_WIRE_FORMAT, MODEL_RATE_LIMITS
+from src.benchmark.fake_server import FakeOpenAIServer
+from src.cache import getDefaultCache
+from src.rate_limit import getRateLimitStats
+from src.models import ModelManager
+
+def getSyntheticTables(row_count, column_count, target_row_count=args.TARGET_ROW_COUNT):
+    def cell(i, j):
+        kind = j % 4
+        if kind == 0:
+            return f"name {i} {j}"
+        if kind == 1:
+            return i * (j + 1)
+        if kind == 2:
+            return f"2023-{1 + i % 12:02d}-{1 + i % 28:02d}"
+        return ["red", "green", "blue"][i % 3]
+    source = pd.DataFrame({f"source_col_{j}":[cell(i, j) for i in range(row_count)] for j in range(column_count)})
+    target = pd.DataFrame({f"Target Col {j}":[str(cell(i, j)).upper() for i in range(target_row_count)] for j in range(column_count)})
+    return source, target
+
+def getPeakRSS():
+    """Peak resident set size of the process in MB (ru_maxrss is in KB on Linux, bytes on macOS).
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def getRateLimitWait():
+    return sum(stats["wait_seconds"] for stats in getRateLimitStats().values())
+
+def measure(server, stage, row_count, column_count, function):
+    server.reset()
+    rate_limit_wait = getRateLimitWait()
+    start = time.perf_counter()
+    function()
+    result = {"stage":stage,
+              "rows":row_count,
+              "columns":column_count,
+              "wall_time":round(time.perf_counter() - start, 3),
+              "peak_rss_mb":round(getPeakRSS(), 1),
+              "rate_limit_wait":round(getRateLimitWait() - rate_limit_wait, 3)}     # summed over the waiting requests
+    result.update(server.stats)
+    return result
+
+def runBenchmark(server, model_name, row_count, column_count, max_workers, wire_format=APPLIER_WIRE_FORMAT):
+    source, target = getSyntheticTables(row_count, column_count)
+    manager = ModelManager(model_name, "sk-fake", server.url,
+                           source=source, target=target,
+                           max_workers=max_workers, checkpoints=False, plans=False,
+                           wire_format=wire_format)
+    results = [measure(server, "confirmation", row_count, column_count, manager.getConfirmationMessage)]
+
+    def getTable():
+        for _ in manager.getTable():
+            pass
+    results.append(measure(server, "table", row_count, column_count, getTable))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MapGPT throughput benchmark")
+    parser.add_argument("--model", default=args.MODEL_NAME)
+    parser.add_argument("--rows", type=int, nargs="+", default=args.ROW_COUNTS)
+    parser.add_argument("--columns", type=int, nargs="+", default=args.COLUMN_COUNTS)
+    parser.add_argument("--latency", type=float, default=args.LATENCY)
+    parser.add_argument("--tokens_per_second", type=float, default=args.TOKENS_PER_SECOND)
+    parser.add_argument("--error_rate", type=float, default=args.ERROR_RATE)
+    parser.add_argument("--max_workers", type=int, default=APPLIER_MAX_WORKERS)
+    parser.add_argument("--wire_format", default=APPLIER_WIRE_FORMAT)
+    parser.add_argument("--requests_per_minute", type=int, default=None, help="rate limit of the model, 0 means no limit")
+    parser.add_argument("--tokens_per_minute", type=int, default=None, help="rate limit of the model, 0 means no limit")
+    parser.add_argument("--output", default="", help="JSON lines file for the results")
+    options = parser.parse_args()
+
+    # every request needs to reach the server to be measured
+    getDefaultCache().enabled = False
+    if options.requests_per_minute is not None or options.tokens_per_minute is not None:
+        requests_per_minute, tokens_per_minute = MODEL_RATE_LIMITS.get(options.model, (0, 0))
+        MODEL_RATE_LIMITS[options.model] = (options.requests_per_minute if options.requests_per_minute is not None else requests_per_minute,
+                                            options.tokens_per_minute if options.tokens_per_minute is not None else tokens_per_minute)
+
+    server = FakeOpenAIServer(latency=options.latency,
+                              tokens_per_second=options.tokens_per_second,
+                              error_rate=options.error_rate)
+    server.start()
+    output = open(options.output, "w") if options.output else None
+    header = (f"{'stage':<14}{'rows':>8}{'columns':>9}{'wall(s)':>10}{'requests':>10}{'prompt':>10}{'completion':>12}{'errors':>8}"
+              f"{'wait(s)':>10}{'rss(MB)':>10}")
+    print(header)
+    try:
+        for row_count in options.rows:
+            for column_count in options.columns:
+                for result in runBenchmark(server, options.model, row_count, column_count, options.max_workers, options.wire_format):
+                    print(f"{result['stage']:<14}{result['rows']:>8}{result['columns']:>9}{result['wall_time']:>10}"
+                          f"{result['requests']:>10}{result['prompt_tokens']:>10}{result['completion_tokens']:>12}"
+                          f"{result['errors']:>8}{result['rate_limit_wait']:>10}{result['peak_rss_mb']:>10}")
+                    if output:
+                        output.write(json.dumps(result) + "\n")
+    finally:
+        if output:
+            output.close()
+        server.stop()
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from src import args
+
+def getApiBase(openai_api_base=""):
+    """The backend the requests go to: the given API base, else OPENAI_API_BASE like the OpenAI client, else OpenAI.
+    It is part of the cache, plan and checkpoint keys so that e.g. the answers of the fake server are never reused
+    against OpenAI.
+    """
+    return (openai_api_base or os.getenv("OPENAI_API_BASE") or args.OPENAI_API_BASE).rstrip("/")
+
+class ResponseCache:
+    """Content-addressed on-disk cache for raw LLM completions.
+    Keys are the hash of the backend, the model name, the temperature and the rendered messages, so the same prompt
+    sent to the same model is only paid once. Entries expire after ttl seconds and the least recently
+    used ones are evicted once there are more than max_entries.
+    """
+    def __init__(self, path=args.CACHE_PATH,
+                 max_entries=args.CACHE_MAX_ENTRIES,
+                 ttl=args.CACHE_TTL_SECONDS,
+                 enabled=args.CACHE_ENABLED):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                        key TEXT PRIMARY KEY,
+                                        response TEXT,
+                                        created_at REAL,
+                                        accessed_at REAL)""")
+            self.connection.commit()
+        return self.connection
+
+    @staticmethod
+    def getKey(model_name, messages, temperature=0, api_base=""):
+        payload = json.dumps({"api_base":getApiBase(api_base),
+                              "model":model_name,
+                              "temperature":temperature,
+                              "messages":messages}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        if not self.enabled:
+            return
+        with self.lock:
+            connection = self.connect()
+            now = time.time()
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, now, now))
+            self.evict(connection, now)
+            connection.commit()
+
+    def evict(self, connection, now):
+        if self.ttl:
+            connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        if self.max_entries:
+            connection.execute("""DELETE FROM responses WHERE key IN (
+                                    SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+                               (self.max_entries,))
+
+    def clear(self):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("DELETE FROM responses")
+            connection.commit()
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits":self.hits,
+            "misses":self.misses,
+            "hit_rate":self.hits / total if total else 0.0
+        }
+
+_default_cache = None
+
+def getDefaultCache():
+    """Process-wide cache shared by every model unless another one is plugged in.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
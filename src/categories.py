@@ -0,0 +1,68 @@
+import re
+from src import args
+from src.plan import getColumnProfile
+from src.transforms import columnToString, cellToString
+
+def normalizeValue(value):
+    """Lower case words of a cell, e.g. "Gold-Plan " becomes "gold plan".
+    """
+    return " ".join(re.split(r"[^0-9a-z]+", str(value).lower())).strip()
+
+def isCategorical(column):
+    """True for the text columns with a small closed set of values repeated across the rows, like plan or status.
+    """
+    values = columnToString(column)
+    values = values[values != ""]
+    distinct_count = values.nunique()
+    return (1 < distinct_count <= args.CATEGORICAL_MAX_VALUES
+            and distinct_count <= args.CATEGORICAL_RATIO * len(values)
+            and getColumnProfile(column) == "text")
+
+class ValueIndex:
+    """Allowed values of the categorical target columns with their normalized forms, used to rewrite the generated
+    cells which only differ from an allowed value in case, spacing or punctuation (e.g. "gold-plan" to "Gold Plan").
+    Cells with other words are never changed, since a similar value can have another meaning ("Not Active", "Active").
+    """
+    def __init__(self, target, confirmed_row=None):
+        self.values = {}                        # {target column: [allowed values]}
+        self.normalized = {}                    # {target column: {normalized value: allowed value}}
+        for col in target.columns:
+            if not isCategorical(target[col]):
+                continue
+            values = [value for value in columnToString(target[col]).unique() if value != ""]
+            normalized = {normalizeValue(value):value for value in values}
+            if confirmed_row is not None and col in confirmed_row.columns:
+                # a confirmed value out of the allowed values means the user wants another style for the column
+                confirmed = cellToString(confirmed_row[col].iloc[0])
+                if confirmed and normalizeValue(confirmed) not in normalized:
+                    continue
+            self.values[col] = values
+            self.normalized[col] = normalized
+
+    def snapColumn(self, column, col):
+        """Returns the column with its cells snapped to the allowed values of col, and the number of snapped cells.
+        Empty cells and cells which are not an allowed value once normalized are kept.
+        """
+        cells = columnToString(column)
+        distinct = [value for value in cells.unique() if value != "" and value not in self.values[col]]
+        snapped = {}
+        for value in distinct:
+            allowed = self.normalized[col].get(normalizeValue(value))
+            if allowed is not None:
+                snapped[value] = allowed
+        if not snapped:
+            return column, 0
+        mask = cells.isin(list(snapped))
+        return cells.where(~mask, cells.map(snapped)), int(mask.sum())
+
+    def snap(self, table):
+        """Snaps the categorical columns of the table. Returns the table and {column: number of snapped cells}.
+        """
+        table = table.copy()
+        counts = {}
+        for col in self.values:
+            if col in table.columns:
+                table[col], count = self.snapColumn(table[col], col)
+                if count:
+                    counts[col] = count
+        return table, counts
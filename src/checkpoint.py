@@ -0,0 +1,60 @@
+import os
+import io
+import time
+import sqlite3
+import threading
+import pandas as pd
+from src import args
+
+class CheckpointStore:
+    """Local store of the completed getTable chunks so that an interrupted job can be resumed.
+    Chunks are keyed by the job id, the plan hash (everything the generated rows depend on) and the row range.
+    """
+    def __init__(self, path=args.CHECKPOINT_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS chunks (
+                                        job_id TEXT,
+                                        plan_hash TEXT,
+                                        start_index INTEGER,
+                                        end_index INTEGER,
+                                        data TEXT,
+                                        created_at REAL,
+                                        PRIMARY KEY (job_id, plan_hash, start_index, end_index))""")
+            self.connection.commit()
+        return self.connection
+
+    def get(self, job_id, plan_hash, start_index, end_index):
+        with self.lock:
+            row = self.connect().execute("""SELECT data FROM chunks
+                                            WHERE job_id = ? AND plan_hash = ? AND start_index = ? AND end_index = ?""",
+                                         (job_id, plan_hash, start_index, end_index)).fetchone()
+        if row is None:
+            return None
+        return pd.read_json(io.StringIO(row[0]), orient="split", dtype=False)
+
+    def set(self, job_id, plan_hash, start_index, end_index, table):
+        data = table.to_json(orient="split", index=False)
+        with self.lock:
+            connection = self.connect()
+            connection.execute("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)",
+                               (job_id, plan_hash, start_index, end_index, data, time.time()))
+            connection.commit()
+
+    def clear(self, job_id):
+        with self.lock:
+            connection = self.connect()
+            connection.execute("DELETE FROM chunks WHERE job_id = ?", (job_id,))
+            connection.commit()
+
+    def count(self, job_id):
+        with self.lock:
+            return self.connect().execute("SELECT COUNT(*) FROM chunks WHERE job_id = ?", (job_id,)).fetchone()[0]
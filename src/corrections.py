@@ -0,0 +1,67 @@
+import numpy as np
+from src import args
+from src.similarity import getNgrams
+from src.categories import normalizeValue
+from src.transforms import columnToString
+
+def getChangedCells(table, edited_table):
+    """Returns {column: [row positions]} of the cells which differ between the table and its edited copy.
+    """
+    changed = {}
+    for col in table.columns:
+        if col not in edited_table.columns:
+            continue
+        mask = columnToString(table[col]).values != columnToString(edited_table[col]).values
+        if mask.any():
+            changed[col] = np.flatnonzero(mask).tolist()
+    return changed
+
+class SimilarValueIndex:
+    """Row positions of every normalized cell value of the columns of a table, with the character n-grams of the values,
+    built once per column on its first use.
+    Rows whose cells in the given columns are the same value, or a value with at least threshold n-gram (Jaccard)
+    similarity, are considered similar, e.g. the rows with "Gold Plan" or "gold plan (annual)" when the user corrected
+    the row with "Gold Plan".
+    """
+    def __init__(self, table, threshold=args.CORRECTION_SIMILARITY):
+        self.table = table
+        self.threshold = threshold
+        self.rows = {}                          # {column: {normalized value: row positions}}
+        self.ngrams = {}                        # {column: {n-gram: normalized values}}
+
+    def getRows(self, col):
+        if col not in self.rows:
+            values = columnToString(self.table[col]).reset_index(drop=True).map(normalizeValue)
+            self.rows[col] = {value:rows.values for value, rows in values.groupby(values).groups.items()}
+            ngrams = {}
+            for value in self.rows[col]:
+                for ngram in set(getNgrams(value)):
+                    ngrams.setdefault(ngram, []).append(value)
+            self.ngrams[col] = ngrams
+        return self.rows[col]
+
+    def getSimilarValues(self, col, value):
+        """The values of the column similar to the value (including itself). An empty value is only similar to itself.
+        """
+        self.getRows(col)
+        if not value or self.threshold >= 1:
+            return [value]
+        ngrams = set(getNgrams(value))
+        shared = {}
+        for ngram in ngrams:
+            for other in self.ngrams[col].get(ngram, []):
+                shared[other] = shared.get(other, 0) + 1
+        return [other for other, count in shared.items()
+                if other and count / (len(ngrams) + len(set(getNgrams(other))) - count) >= self.threshold] + [value]
+
+    def getSimilarRows(self, row, columns):
+        """Rows whose cells are similar to the cells of the row in every given column.
+        """
+        similar = None
+        for col in columns:
+            value = normalizeValue(columnToString(self.table[col].iloc[[row]]).iloc[0])
+            rows = self.getRows(col)
+            col_rows = np.unique(np.concatenate([rows.get(other, np.array([], dtype=int)) 
+                                                 for other in self.getSimilarValues(col, value)]).astype(int))
+            similar = col_rows if similar is None else np.intersect1d(similar, col_rows)
+        return set() if similar is None else set(similar.tolist())
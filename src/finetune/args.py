@@ -11,5 +11,7 @@ DELETE_PERCENTAGE_LIMIT = 0.3   # For each row pair, some percetange of source c
 DELETE_PROB = 0.1 # Deleting column probablity
 SHUFFLE_COLUMNS_PROB = 0.05
 EXAMPLE_PER_ROW = 1
+ROWS_PER_EXAMPLE = 1    # If it is more than 1, that many source rows are put into one example keyed by their row ids (batched fine-tuned model)
 
-SYSTEM_MESSAGE = """You are a helper assistant that can transform Source JSON by looking at the Examples"""
\ No newline at end of file
+SYSTEM_MESSAGE = """You are a helper assistant that can transform Source JSON by looking at the Examples"""
+BATCH_SYSTEM_MESSAGE = """You are a helper assistant that can transform each row of the Source JSON rows by looking at the Examples and keep its row id"""
@@ -66,39 +66,52 @@ for filename in tqdm(os.listdir(args.ORIGINAL_DATA_ROOT)):
     
     column_mapping = column_mapping_data[file_index][f"{other_type}_to_{file_type}"]
     
-    for row_index in range(source_data.shape[0]):
+    # with ROWS_PER_EXAMPLE > 1, consecutive rows are put into one example keyed by their row ids
+    for row_index in range(0, source_data.shape[0], args.ROWS_PER_EXAMPLE):
+        row_indices = list(range(row_index, min(row_index + args.ROWS_PER_EXAMPLE, source_data.shape[0])))
         for _ in range(args.EXAMPLE_PER_ROW):
             source_columns, target_columns = utils.selectColumns(source_data.columns, target_data.columns)
             
-            all_target_indices = list(range(row_index)) + list(range(row_index + 1,target_data.shape[0]))
-            selected_example_indices = random.sample(all_target_indices, min(target_data.shape[0],args.TARGET_ROW_PER_SOURCE_ROW))
+            all_target_indices = [i for i in range(target_data.shape[0]) if i not in row_indices]
+            selected_example_indices = random.sample(all_target_indices, min(len(all_target_indices),args.TARGET_ROW_PER_SOURCE_ROW))
             
             example_json  = target_data.loc[selected_example_indices,target_columns].to_dict()
-            source_json   = source_data.loc[row_index,source_columns].to_dict()
-            target_json   = target_data.loc[row_index,target_columns].to_dict()
-            target_json = utils.finalize(source_json, target_json, column_mapping) 
+            source_jsons = {}
+            target_jsons = {}
+            for index in row_indices:
+                source_jsons[index] = source_data.loc[index,source_columns].to_dict()
+                target_json = target_data.loc[index,target_columns].to_dict()
+                target_jsons[index] = utils.finalize(source_jsons[index], target_json, column_mapping) 
             
             # shuffle the keys randomly
-            source_key_correspondance = utils.getKeyCorrespondance(source_json)
-            target_key_correspondance = utils.getKeyCorrespondance(target_json)
+            source_key_correspondance = utils.getKeyCorrespondance(source_jsons[row_index])
+            target_key_correspondance = utils.getKeyCorrespondance(target_jsons[row_index])
             
-            source_json = {source_key_correspondance[k]:v for k, v in source_json.items()}
-            target_json = {target_key_correspondance[k]:v for k, v in target_json.items()}
+            source_jsons = {index:{source_key_correspondance[k]:v for k, v in source_json.items()} for index, source_json in source_jsons.items()}
+            target_jsons = {index:{target_key_correspondance[k]:v for k, v in target_json.items()} for index, target_json in target_jsons.items()}
             example_json = {target_key_correspondance[k]:v for k, v in example_json.items()}
 
             examples_str = json.dumps(example_json)
-            source_str = json.dumps(source_json)
-            target_str = json.dumps(target_json)
+            if args.ROWS_PER_EXAMPLE > 1:
+                system_message = args.BATCH_SYSTEM_MESSAGE
+                source_label = "Source JSON rows"
+                source_str = json.dumps({str(index):source_json for index, source_json in source_jsons.items()})
+                target_str = json.dumps({str(index):target_json for index, target_json in target_jsons.items()})
+            else:
+                system_message = args.SYSTEM_MESSAGE
+                source_label = "Source JSON"
+                source_str = json.dumps(source_jsons[row_index])
+                target_str = json.dumps(target_jsons[row_index])
             
             user_content = f"""Examples:
 {examples_str}
         
-Source JSON:
+{source_label}:
 {source_str}
             """
             assistant_content = target_str
             messages = [
-                {"role": "system", "content":args.SYSTEM_MESSAGE},
+                {"role": "system", "content":system_message},
                 {"role": "user", "content":user_content},
                 {"role": "assistant", "content":assistant_content}
             ]
@@ -0,0 +1,260 @@
+"""Local instrumentation of the LLM calls: wall time, queue wait, tokens, retries, parse failures and estimated cost,
+tagged by the model class and the pipeline stage (confirmation, table, finetuned).
+
+startMetricsServer (started by app.py when MAPGPT_METRICS_PORT is set) serves the Prometheus text at /metrics and the
+recorded calls as JSON lines at /calls. With MAPGPT_METRICS_PATH, every call is also appended to that JSON lines file.
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src import args
+from src.tokens import getModelValue
+
+_stage = contextvars.ContextVar("mapgpt_stage", default="")
+
+@contextmanager
+def useStage(stage):
+    """Tags the calls made in the block (in this thread) with the pipeline stage.
+    """
+    token = _stage.set(stage)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+def getStage():
+    return _stage.get()
+
+def runInStage(stage, function, *arguments):
+    """Runs function in the stage, e.g. executor.submit(runInStage, "table", function, ...) for a worker thread.
+    """
+    with useStage(stage):
+        return function(*arguments)
+
+def getCost(model_name, prompt_tokens, completion_tokens):
+    """Estimated dollars of the tokens with the prices of MODEL_PRICES.
+    """
+    input_price, output_price = getModelValue(model_name, args.MODEL_PRICES, args.DEFAULT_PRICES)
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1000
+
+class Histogram:
+    """Cumulative buckets of a Prometheus histogram.
+    """
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class Series:
+    """Counters and histograms of the calls of a model class in a stage.
+    """
+    COUNTERS = ("calls", "cached_calls", "errors", "retries", "parse_failures", "prompt_tokens", "completion_tokens", "cost_dollars")
+
+    def __init__(self):
+        self.counters = {name:0 for name in Series.COUNTERS}
+        self.histograms = {"call_seconds":Histogram(args.METRICS_LATENCY_BUCKETS),
+                           "queue_wait_seconds":Histogram(args.METRICS_LATENCY_BUCKETS),
+                           "prompt_tokens":Histogram(args.METRICS_TOKEN_BUCKETS),
+                           "completion_tokens":Histogram(args.METRICS_TOKEN_BUCKETS)}
+
+    def record(self, call):
+        self.counters["calls"] += 1
+        self.counters["cached_calls"] += int(call["cached"])
+        self.counters["errors"] += int(bool(call["error"]))
+        self.counters["retries"] += call["retries"]
+        self.counters["prompt_tokens"] += call["prompt_tokens"]
+        self.counters["completion_tokens"] += call["completion_tokens"]
+        self.counters["cost_dollars"] += call["cost"]
+        self.histograms["call_seconds"].observe(call["wall_seconds"])
+        self.histograms["queue_wait_seconds"].observe(call["queue_wait_seconds"])
+        if not call["cached"]:
+            self.histograms["prompt_tokens"].observe(call["prompt_tokens"])
+            self.histograms["completion_tokens"].observe(call["completion_tokens"])
+
+HELP = {
+    "calls":"LLM calls, including the ones answered from the response cache",
+    "cached_calls":"LLM calls answered from the response cache",
+    "errors":"LLM calls which failed after their retries",
+    "retries":"Retried requests of the LLM calls",
+    "parse_failures":"LLM answers which could not be parsed completely",
+    "prompt_tokens":"Estimated prompt tokens sent",
+    "completion_tokens":"Estimated completion tokens received",
+    "cost_dollars":"Estimated cost in dollars",
+    "call_seconds":"Wall time of the LLM calls in seconds, including the queue wait and the retries",
+    "queue_wait_seconds":"Seconds the LLM calls waited for the rate limiter",
+}
+
+class Metrics:
+    """Thread-safe registry of the LLM calls. The last METRICS_MAX_CALLS calls are kept for the JSON lines export.
+    """
+    def __init__(self, path=args.METRICS_PATH, max_calls=args.METRICS_MAX_CALLS):
+        self.path = path                        # JSON lines file every call is appended to, "" disables it
+        self.lock = threading.Lock()
+        self.calls = deque(maxlen=max_calls)
+        self.series = {}                        # {(model class, model name, stage): Series}
+
+    def getSeries(self, model_class, model_name, stage):
+        key = (model_class, model_name, stage)
+        if key not in self.series:
+            self.series[key] = Series()
+        return self.series[key]
+
+    def write(self, event):
+        self.calls.append(event)
+        if self.path:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(event) + "\n")
+
+    def record(self, call):
+        """Records a finished call (see startCall).
+        """
+        call["cost"] = 0.0 if call["cached"] else getCost(call["model"], call["prompt_tokens"], call["completion_tokens"])
+        call["wall_seconds"] = round(call["wall_seconds"], 4)
+        call["queue_wait_seconds"] = round(call["queue_wait_seconds"], 4)
+        with self.lock:
+            self.getSeries(call["model_class"], call["model"], call["stage"]).record(call)
+            self.write(call)
+
+    def recordParseFailure(self, model_class, model_name):
+        stage = getStage()
+        with self.lock:
+            self.getSeries(model_class, model_name, stage).counters["parse_failures"] += 1
+            self.write({"event":"parse_failure", "time":time.time(), "model_class":model_class, "model":model_name, "stage":stage})
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.series = {}
+
+    def getSummary(self):
+        """Counters of every model class and stage, with the mean call and queue wait seconds.
+        """
+        with self.lock:
+            summary = []
+            for (model_class, model_name, stage), series in self.series.items():
+                row = {"model_class":model_class, "model":model_name, "stage":stage}
+                row.update(series.counters)
+                row["cost_dollars"] = round(row["cost_dollars"], 6)
+                for name in ("call_seconds", "queue_wait_seconds"):
+                    histogram = series.histograms[name]
+                    row[f"mean_{name}"] = round(histogram.sum / histogram.count, 4) if histogram.count else 0.0
+                summary.append(row)
+        return summary
+
+    def getJsonLines(self):
+        with self.lock:
+            return "".join(json.dumps(call) + "\n" for call in self.calls)
+
+    def writeJsonLines(self, path):
+        with open(path, "w") as f:
+            f.write(self.getJsonLines())
+
+    def getPrometheusText(self):
+        """The counters and histograms in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            series = list(self.series.items())
+            for name in Series.COUNTERS:
+                metric = f"mapgpt_{name}_total"
+                lines.append(f"# HELP {metric} {HELP[name]}")
+                lines.append(f"# TYPE {metric} counter")
+                for key, values in series:
+                    lines.append(f"{metric}{{{getLabels(*key)}}} {values.counters[name]}")
+            for name in ("call_seconds", "queue_wait_seconds", "prompt_tokens", "completion_tokens"):
+                metric = f"mapgpt_{name}" if name.endswith("seconds") else f"mapgpt_{name}_per_call"
+                lines.append(f"# HELP {metric} {HELP[name]}")
+                lines.append(f"# TYPE {metric} histogram")
+                for key, values in series:
+                    histogram = values.histograms[name]
+                    labels = getLabels(*key)
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {round(histogram.sum, 6)}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+def getLabels(model_class, model_name, stage):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'model_class="{escape(model_class)}",model="{escape(model_name)}",stage="{escape(stage)}"'
+
+def startCall(model):
+    """The record of a call of the model, filled by the model and given to Metrics.record when the call is finished.
+    """
+    return {"event":"call",
+            "time":time.time(),
+            "model_class":type(model).__name__,
+            "model":model.model_name,
+            "stage":getStage(),
+            "wall_seconds":0.0,
+            "queue_wait_seconds":0.0,
+            "prompt_tokens":0,
+            "completion_tokens":0,
+            "retries":0,
+            "cached":False,
+            "error":"",
+            "start":time.perf_counter()}
+
+def finishCall(call, error=None):
+    call["wall_seconds"] = time.perf_counter() - call.pop("start")
+    if error is not None:
+        call["error"] = type(error).__name__
+    _metrics.record(call)
+
+_metrics = Metrics()
+
+def getMetrics():
+    return _metrics
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *arguments):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            body, content_type = _metrics.getPrometheusText(), "text/plain; version=0.0.4"
+        elif path == "/calls":
+            body, content_type = _metrics.getJsonLines(), "application/x-ndjson"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_server = None
+_server_lock = threading.Lock()
+
+def startMetricsServer(port=args.METRICS_PORT, host=args.METRICS_HOST):
+    """Serves /metrics and /calls in a background thread, once per process. Returns the server.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
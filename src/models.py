@@ -8,10 +8,51 @@ from langchain.prompts.chat import (ChatPromptTemplate,
                                     SystemMessagePromptTemplate)
 from src.utils import (getExamples, getRow, dict2row, getRowDF, 
                        getTableString, prepareDFForCell, prepareDFForCellV2,
-                       getMappingFromRowResult, getColumnGroups)
-from src import prompts
+                       getMappingFromRowResult, getColumnGroups,
+                       getLineageFromRow, isLowCardinality, getConstantColumns,
+                       getColumnFingerprint, getEmptySourceMask,
+                       getVerifiedLineage)
+from src import prompts, args
+from src.cache import getDefaultCache, getApiBase
+from src.tokens import countTokens, packRows, getModelLimits
+from src.rate_limit import getRateLimiter, getRetryDelay
+from src.transforms import compileTransforms, applyTransforms, columnToString, cellToString, getLineage, isCommonValue
+from src.checkpoint import CheckpointStore
+from src.wire_formats import getWireFormat, compareWireFormats, MALFORMED
+from src.plan import PlanStore, getPlan, getSchemaFingerprint
+from src.similarity import matchColumns
+from src.categories import ValueIndex
+from src.corrections import SimilarValueIndex, getChangedCells
+from src.metrics import startCall, finishCall, getMetrics, useStage, runInStage
+from src.tracing import span, traceStage
+from concurrent.futures import ThreadPoolExecutor, Future, wait
 import ast
+import hashlib
+import openai
+import queue
 import math
+import threading
+import time
+
+_llms = {}
+_llms_lock = threading.Lock()
+
+def getLLM(model_name, openai_api_key, openai_api_base):
+    """Returns the chat model shared by every model of the same backend so that they reuse one client and its connection pool.
+    """
+    key = (model_name, openai_api_key, openai_api_base)
+    with _llms_lock:
+        if key not in _llms:
+            _llms[key] = ChatOpenAI(
+                model=model_name,
+                openai_api_key=openai_api_key,
+                temperature=0,
+                openai_api_base=openai_api_base,
+                request_timeout=120,
+                # with the shared rate limiter, the requests are retried by BaseModel
+                max_retries=0 if args.RATE_LIMIT_ENABLED else 6
+            )
+        return _llms[key]
 
 class BaseModel:
     def __init__(self, model_name="gpt-3.5-turbo", 
@@ -20,20 +61,18 @@ class BaseModel:
                  system_template="", 
                  human_template="",
                  is_json = True,
-                 name="Base Model"
+                 name="Base Model",
+                 cache=None
                  ):
         if model_name == "finetuned_model":
             model_name = "ft:gpt-3.5-turbo-0613:invesya::8EIwnib4"
         self.model_name = model_name
-        self.llm = ChatOpenAI(
-            model=model_name,
-            openai_api_key=openai_api_key,
-            temperature=0,
-            openai_api_base=openai_api_base,
-            request_timeout=120
-        )
+        self.api_base = getApiBase(openai_api_base)
+        self.llm = getLLM(model_name, openai_api_key, openai_api_base)
         self.name=name
         self.is_json = is_json
+        self.cache = cache if cache is not None else getDefaultCache()
+        self.use_cache = True
         self.initChain(system_template, human_template)
         
     def initChain(self, system_template="", human_template=""):
@@ -53,8 +92,130 @@ class BaseModel:
         end_index = json_string.rfind("}") + 1
         return json_string[start_index:end_index]
         
-    def __call__(self, **kwargs):
-        res = self.chain.run(**kwargs)
+    def run(self, use_cache=True, **kwargs):
+        """Runs the chain unless the same rendered prompt has already been answered by the same model.
+        With use_cache=False, the cached answer is ignored (e.g. for retries) and replaced by the new one.
+        """
+        messages = [(message.type, message.content) for message in self.chain.prompt.format_messages(**kwargs)]
+        call = startCall(self)
+        try:
+            if not self.use_cache:
+                res = self.request(messages, lambda: self.chain.run(**kwargs), call)
+            else:
+                key = self.cache.getKey(self.model_name, messages, self.llm.temperature, self.api_base)
+                res = self.cache.get(key) if use_cache else None
+                if res is None:
+                    res = self.request(messages, lambda: self.chain.run(**kwargs), call)
+                    self.cache.set(key, res)
+                else:
+                    call["cached"] = True
+        except Exception as e:
+            finishCall(call, e)
+            raise
+        self.countCallTokens(call, messages, res)
+        finishCall(call)
+        return res
+    
+    def countCallTokens(self, call, messages, res):
+        """Estimated tokens of a call for the metrics, a cached call sends none.
+        """
+        if not call["cached"]:
+            call["prompt_tokens"] = countTokens("\n".join(content for _, content in messages), self.model_name)
+            call["completion_tokens"] = countTokens(res, self.model_name)
+    
+    def getReservation(self, messages):
+        """Returns the prompt tokens and the tokens reserved in the rate limiter for the request.
+        """
+        prompt_tokens = countTokens("\n".join(content for _, content in messages), self.model_name)
+        output_tokens = min(int(prompt_tokens * args.RATE_LIMIT_OUTPUT_RATIO), getModelLimits(self.model_name)[1])
+        return prompt_tokens, prompt_tokens + output_tokens
+    
+    def request(self, messages, function, call=None):
+        """Runs function (the request of the messages) within the rate limits of the model.
+        Rate limited requests are retried after their Retry-After, transient errors with exponential backoff.
+        The queue wait and the retries are counted in call (see src/metrics.py).
+        """
+        limiter = getRateLimiter(self.model_name)
+        if limiter is None:
+            with span(type(self).__name__, "llm", model=self.model_name):
+                return function()
+        prompt_tokens, reserved_tokens = self.getReservation(messages)
+        for attempt in range(args.RATE_LIMIT_MAX_RETRIES + 1):
+            with span("rate limit wait", "wait"):
+                waited = limiter.acquire(reserved_tokens)
+            if call is not None:
+                call["queue_wait_seconds"] += waited
+                call["retries"] = attempt
+            try:
+                with span(type(self).__name__, "llm", model=self.model_name, attempt=attempt):
+                    res = function()
+            except Exception as e:
+                limiter.reconcile(reserved_tokens, 0)
+                delay = getRetryDelay(e, attempt)
+                if delay is None or attempt == args.RATE_LIMIT_MAX_RETRIES:
+                    raise
+                self.wait(limiter, e, delay)
+                continue
+            limiter.reconcile(reserved_tokens, prompt_tokens + countTokens(res, self.model_name))
+            return res
+    
+    def wait(self, limiter, error, delay):
+        if isinstance(error, openai.error.RateLimitError):
+            # every request of the model waits, not only this one
+            limiter.pause(delay)
+        else:
+            time.sleep(delay)
+        
+    def stream(self, use_cache=True, **kwargs):
+        """Yields the completion piece by piece as the tokens arrive. Cached completions are yielded at once.
+        A request which fails before its first piece is retried as in request.
+        """
+        messages = self.chain.prompt.format_messages(**kwargs)
+        message_texts = [(message.type, message.content) for message in messages]
+        key = self.cache.getKey(self.model_name, message_texts, self.llm.temperature, self.api_base)
+        call = startCall(self)
+        res = self.cache.get(key) if self.use_cache and use_cache else None
+        if res is not None:
+            call["cached"] = True
+            finishCall(call)
+            yield res
+            return
+        limiter = getRateLimiter(self.model_name)
+        if limiter is not None:
+            prompt_tokens, reserved_tokens = self.getReservation(message_texts)
+        for attempt in range(args.RATE_LIMIT_MAX_RETRIES + 1):
+            if limiter is not None:
+                with span("rate limit wait", "wait"):
+                    call["queue_wait_seconds"] += limiter.acquire(reserved_tokens)
+                call["retries"] = attempt
+            pieces = []
+            try:
+                with span(type(self).__name__, "llm", model=self.model_name, attempt=attempt, streaming=True):
+                    for chunk in self.llm.stream(messages):
+                        pieces.append(chunk.content)
+                        yield chunk.content
+            except Exception as e:
+                if limiter is None:
+                    finishCall(call, e)
+                    raise
+                limiter.reconcile(reserved_tokens, 0)
+                delay = getRetryDelay(e, attempt)
+                if pieces or delay is None or attempt == args.RATE_LIMIT_MAX_RETRIES:
+                    finishCall(call, e)
+                    raise
+                self.wait(limiter, e, delay)
+                continue
+            break
+        res = "".join(pieces)
+        if limiter is not None:
+            limiter.reconcile(reserved_tokens, prompt_tokens + countTokens(res, self.model_name))
+        if self.use_cache:
+            self.cache.set(key, res)
+        self.countCallTokens(call, message_texts, res)
+        finishCall(call)
+        
+    def __call__(self, use_cache=True, **kwargs):
+        res = self.run(use_cache, **kwargs)
         if self.is_json:
             res = self.refineJson(res)
         if self.is_json:
@@ -65,6 +226,7 @@ class BaseModel:
                     res = ast.literal_eval(res)
                 except (SyntaxError, ValueError):
                     print("Failed to decode input string")
+                    getMetrics().recordParseFailure(type(self).__name__, self.model_name)
         return res
 
 class RowModel(BaseModel):
@@ -172,40 +334,93 @@ class ColumnMappingsModel(BaseModel):
 class ApplierModel(BaseModel):
     """By looking at the transformation of a single row, it applies the same transformation
     for the other given rows.
+    The tables are written in the prompt in its wire format (see src/wire_formats.py), JSON of the columns by default.
     """
     def __init__(self, model_name="gpt-3.5-turbo", 
                  openai_api_key = os.getenv("OPENAI_API_KEY",""),
-                 openai_api_base=""):
+                 openai_api_base="",
+                 wire_format="json"):
+        self.wire_format = getWireFormat(wire_format)
+        system_template, human_template = self.getTemplates()
         super().__init__(model_name, 
                          openai_api_key, 
                          openai_api_base,
-                         system_template = prompts.applier.system_template,
-                         human_template = prompts.applier.human_template,
+                         system_template = system_template,
+                         human_template = human_template,
                          name="Applier Model"
                          )
+    
+    def getTemplates(self):
+        if self.wire_format.name == "json":
+            return prompts.applier.system_template, prompts.applier.human_template
+        return prompts.applier.table_system_template, prompts.applier.table_human_template
         
-    def refine(self, res):
-        """In case the generated JSON is not valid.
-        """
-        max_count = 0
-        for v in res.values():
-            count = len(v)
-            max_count = max(max_count, count)
-        
-        for k,v in res.items():
-            extra = max_count - len(v)
-            if extra > 0:
-                extra_items = extra * ['']
-                v += extra_items
-                res[k] = v
+    def setWireFormat(self, wire_format):
+        if wire_format == self.wire_format.name:
+            return
+        self.wire_format = getWireFormat(wire_format)
+        self.initChain(*self.getTemplates())
         
-        return res
-                  
+    def getInputs(self, source_json, target_json, table):
+        return self.wire_format.dumpInputs(source_json, target_json, table)
         
-    def __call__(self, **kwargs):
-        res = super().__call__(**kwargs)
-        res = self.refine(res)
-        return pd.DataFrame.from_dict(res)
+    def validate(self, res, row_labels, columns):
+        """Aligns the generated column arrays with the requested rows (their labels in the Source2 table).
+        Returns the table with the requested columns and the positions of the rows which are missing or malformed.
+        Columns answered as {row label: cell} are aligned by their labels. Column arrays carry no row labels, so a short
+        array is considered to be cut at its end.
+        """
+        row_count = len(row_labels)
+        if not isinstance(res, dict):
+            # the completion could not be decoded
+            return pd.DataFrame("", index=range(row_count), columns=columns), list(range(row_count))
+        table = {}
+        missing_rows = set()
+        for col in columns:
+            values = res.get(col)
+            if isinstance(values, dict):
+                cells = {str(label):value for label, value in values.items()}
+                labels = [str(label) for label in row_labels]
+                if len(cells) == row_count and not set(cells) & set(labels):
+                    # the model numbered the rows again, every row is answered so they are taken in order
+                    values = list(cells.values())
+                else:
+                    values = [cells.get(label, MALFORMED) for label in labels]
+            elif not isinstance(values, list):
+                values = [values] if values is not None and row_count == 1 else []
+            values = values[:row_count]
+            missing_rows |= set(range(len(values), row_count))
+            values = values + [""] * (row_count - len(values))
+            for i, value in enumerate(values):
+                if isinstance(value, (dict, list)) or value is MALFORMED:
+                    missing_rows.add(i)
+                    values[i] = ""
+                elif value is None:
+                    values[i] = ""
+            table[col] = values
+        return pd.DataFrame(table, columns=columns), sorted(missing_rows)
+    
+    def generate(self, row_labels, columns, events=None, use_cache=True, **kwargs):
+        """Requests the rows (their labels in the Source2 table) and validates them, see validate. If events is given,
+        the completion is streamed and the number of cells of each generated column (or row) is put into it. Streaming
+        only reports progress: the cells are returned once the whole completion is validated, since a streamed cell might
+        still be malformed or misaligned.
+        """
+        if events is None:
+            res = self.run(use_cache, **kwargs)
+        else:
+            pieces = []
+            parser = self.wire_format.getStreamParser(columns)
+            for piece in self.stream(use_cache=use_cache, **kwargs):
+                pieces.append(piece)
+                for cell_count in parser.feed(piece):
+                    events.put(cell_count)
+            res = "".join(pieces)
+        with span("parse", rows=len(row_labels)):
+            table, missing_rows = self.validate(self.wire_format.parse(res, columns), row_labels, columns)
+        if missing_rows:
+            getMetrics().recordParseFailure(type(self).__name__, self.model_name)
+        return table, missing_rows
     
 class FeedbackRowModel(BaseModel):
     """By looking at the feedback coming from the user it refines the row model's result.
@@ -391,73 +606,87 @@ class FinetunedModel(BaseModel):
                          name="Finetuned Model"
                          )       
     
+class FinetunedBatchModel(BaseModel):
+    """Finetuned Model trained on several source rows per request (see ROWS_PER_EXAMPLE in src/finetune/args.py).
+    The source rows are keyed by their row ids and the result maps the same ids to the target rows.
+    """
+    def __init__(self, model_name="gpt-3.5-turbo", 
+                 openai_api_key = os.getenv("OPENAI_API_KEY",""),
+                 openai_api_base=""):
+        if model_name == "finetuned_model" and args.FINETUNED_BATCH_MODEL:
+            model_name = args.FINETUNED_BATCH_MODEL
+        super().__init__(model_name, 
+                         openai_api_key, 
+                         openai_api_base,
+                         system_template = prompts.finetuned.batch_system_template,
+                         human_template = prompts.finetuned.batch_human_template,
+                         name="Finetuned Batch Model"
+                         )
+        
+    def __call__(self, use_cache=True, **kwargs):
+        """Returns the generated target rows by their row ids. The rows which cannot be decoded are left out.
+        """
+        res = super().__call__(use_cache, **kwargs)
+        if not isinstance(res, dict):
+            return {}
+        rows = {}
+        for row_id, row in res.items():
+            try:
+                row_id = int(row_id)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(row, dict):
+                rows[row_id] = row
+        return rows
+    
 class ModelManager:
+    # models are built on their first access instead of all at once
+    MODELS = {
+        "row_model":RowModel,
+        "cell_model":CellModel,
+        "cell_model_v2":CellModelV2,
+        "column_mappings_model":ColumnMappingsModel,
+        "applier_model":ApplierModel,
+        "feedback_row_model":FeedbackRowModel,
+        "feedback_cell_model":FeedbackCellModel,
+        "refiner_model":RefinerModel,
+        "json2paragraph_model":Json2ParagraphModel,
+        "json2paragraph_source_model":Json2ParagraphSourceModel,
+        "column_transformer_model":ColumnTransformerModel,
+        "column_renamer_model":ColumnRenamerModel,
+        "target_table_pattern_finder_model":TargetTablePatternFinderModel,
+        "target_table_pattern_applier_model":TargetTablePatternApplierModel,
+        "finetuned_model":FinetunedModel,
+        "finetuned_batch_model":FinetunedBatchModel,
+    }
+    models_lock = threading.Lock()
+    
     def __init__(self,
                  model_name, 
                  openai_api_key, 
                  openai_api_base,
                  source=None,
                  target=None,
-                 CELL_LIMIT=50):
-        self.row_model = RowModel(model_name=model_name, 
-                                  openai_api_key=openai_api_key, 
-                                  openai_api_base=openai_api_base)
-        
-        self.cell_model = CellModel(model_name=model_name, 
-                                    openai_api_key=openai_api_key, 
-                                    openai_api_base=openai_api_base)
-        
-        self.cell_model_v2 = CellModelV2(model_name=model_name, 
-                                    openai_api_key=openai_api_key, 
-                                    openai_api_base=openai_api_base)
-        
-        self.column_mappings_model = ColumnMappingsModel(model_name=model_name, 
-                                              openai_api_key=openai_api_key, 
-                                              openai_api_base=openai_api_base)
-        
-        self.applier_model = ApplierModel(model_name=model_name, 
-                                          openai_api_key=openai_api_key, 
-                                          openai_api_base=openai_api_base)
-        
-        self.feedback_row_model = FeedbackRowModel(model_name=model_name, 
-                                               openai_api_key=openai_api_key, 
-                                               openai_api_base=openai_api_base)
-        
-        self.feedback_cell_model = FeedbackCellModel(model_name=model_name, 
-                                               openai_api_key=openai_api_key, 
-                                               openai_api_base=openai_api_base)
-        
-        self.refiner_model = RefinerModel(model_name=model_name, 
-                                          openai_api_key=openai_api_key, 
-                                          openai_api_base=openai_api_base)
-        
-        self.json2paragraph_model = Json2ParagraphModel(model_name, 
-                                                        openai_api_key, 
-                                                        openai_api_base)
-        
-        self.json2paragraph_source_model = Json2ParagraphSourceModel(model_name, 
-                                                              openai_api_key, 
-                                                              openai_api_base)
-        
-        self.column_transformer_model = ColumnTransformerModel(model_name=model_name, 
-                                                               openai_api_key=openai_api_key, 
-                                                               openai_api_base=openai_api_base)
-        
-        self.column_renamer_model = ColumnRenamerModel(model_name=model_name, 
-                                                       openai_api_key=openai_api_key, 
-                                                       openai_api_base=openai_api_base)
-        
-        self.target_table_pattern_finder_model = TargetTablePatternFinderModel(model_name=model_name, 
-                                                                               openai_api_key=openai_api_key, 
-                                                                               openai_api_base=openai_api_base)
-        
-        self.target_table_pattern_applier_model = TargetTablePatternApplierModel(model_name=model_name, 
-                                                                                 openai_api_key=openai_api_key, 
-                                                                                 openai_api_base=openai_api_base)
-        
-        self.finetuned_model = FinetunedModel(model_name=model_name, 
-                                              openai_api_key=openai_api_key, 
-                                              openai_api_base=openai_api_base)
+                 CELL_LIMIT=50,
+                 max_workers=args.APPLIER_MAX_WORKERS,
+                 streaming=args.APPLIER_STREAMING,
+                 token_packing=args.TOKEN_PACKING,
+                 token_budget=None,
+                 compile_transforms=args.COMPILE_TRANSFORMS,
+                 memoize_values=args.MEMOIZE_VALUES,
+                 job_id=None,
+                 checkpoints=args.CHECKPOINT_ENABLED,
+                 wire_format=args.APPLIER_WIRE_FORMAT,
+                 plans=args.PLAN_CACHE_ENABLED,
+                 column_matching=args.COLUMN_MATCHING,
+                 snap_values=args.CATEGORICAL_SNAPPING,
+                 speculate=args.SPECULATION,
+                 prune_sources=args.LINEAGE_PRUNING,
+                 gate_empty=args.EMPTY_SOURCE_GATE,
+                 source_groups=None):
+        self.model_name = model_name
+        self.openai_api_key = openai_api_key
+        self.openai_api_base = openai_api_base
         
         self.target_column_threshold = 20       # it is used to decide for the algorithm used in few shot prompt preparation.
         self.high_target_column_mapping = 30    # it is used to decide for the example count for CellModel
@@ -465,7 +694,8 @@ class ModelManager:
         self.target=target
         if self.target is not None:
             self.original_columns = self.target.columns
-            self.target, self.identical_columns = getColumnGroups(self.target)
+            with span("getColumnGroups", table="target"):
+                self.target, self.identical_columns = getColumnGroups(self.target)
             self.target.fillna("",inplace=True)
             # Convert all Timestamp columns to string
             for col in self.target.select_dtypes(include=["datetime"]).columns:
@@ -474,14 +704,77 @@ class ModelManager:
                 self.source[col] = self.source[col].astype(str)
         
         self.CELL_LIMIT = CELL_LIMIT            # it is used for number of cell generation during the completion of the whole table
+        self.max_workers = max(1, max_workers)  # it is used for number of ApplierModel requests running at the same time
+        self.streaming = streaming              # if it is True, progress is reported as the generated columns arrive, the rows still land per chunk
+        self.token_packing = token_packing      # if it is True, chunks are packed up to the token budget of the model
+        self.token_budget = token_budget        # overrides the context window of the model while packing
+        self.compile_transforms = compile_transforms    # if it is True, the columns which can be compiled from the first row are not sent to the LLM
+        self.transforms = {}
+        self.memoize_values = memoize_values    # if it is True, low-cardinality source columns are transformed once per distinct value
+        self.value_maps = {}
+        self.lineage = {}                       # source columns feeding each target column
+        self.verified_lineage = {}              # source columns each confirmed cell is made of only, see getVerifiedLineage
+        self.failed_rows = []                   # source rows which could not be generated in the last getTable
+        self.failed_rows_lock = threading.Lock()
+        self.job_id = job_id                    # completed chunks are saved under this id, by default it is derived from the tables
+        self.checkpoints = CheckpointStore() if checkpoints is True else checkpoints or None
+        self.wire_format = wire_format          # format of the applier tables, "auto" picks the one with the fewest tokens
+        self.plans = PlanStore() if plans is True else plans or None   # confirmed mapping plans by schema fingerprint
+        self.plan = None                        # the mapping plan loaded instead of the confirmation models
+        self.example_row = None                 # source row of the confirmed first row if it is not the first source row
+        self.original_target = target
+        self.column_matching = column_matching  # if it is True, confidently matched target columns are not sent to the RowModel
+        self.column_matches = {}                # {target column: (source column, similarity)} of the local column matching
+        self.snap_values = snap_values          # if it is True, the cells of categorical target columns are snapped to their allowed values
+        self.snapped_cells = {}                 # {target column: number of snapped cells} of the last getTable
+        self.speculate = speculate              # if it is True, startSpeculation generates the table while the first row is reviewed
+        self.speculation = None                 # the background table of the unedited first row
+        self.confirmed_row = None               # the first row the last table was generated with
+        self.corrected_cells = {}               # {target column: number of regenerated cells} of the last applyCorrections
+        self.prune_sources = prune_sources      # if it is True, the ApplierModel only gets the source columns feeding the requested target columns
+        self.gate_empty = gate_empty            # if it is True, the target cells whose source cells are empty stay empty
+        self.gated_cells = {}                   # {target column: number of generated cells blanked by the gate} of the last getTable
+        self.requested_rows = []                # source rows of the applier requests of the last getTable
             
         self.stage = 0
         
+        self.original_source = self.source
+        self.constant_columns = []
+        self.source_groups = source_groups      # (identical columns, constant columns) of the whole source, found in the source if None
+        if self.source is not None:
+            self.groupSourceColumns()
+        
         if self.source is not None:
             self.SOURCE_ROW_PERIOD = max(1, self.CELL_LIMIT // self.source.shape[1])
         else:
             self.SOURCE_ROW_PERIOD = None
             
+    def groupSourceColumns(self):
+        """Identical source columns are only shown once and constant ones only in the first row of the applier.
+        With source_groups (e.g. found in the whole file by src/batch.py), the groups are not searched in this source,
+        which might be a single chunk of the file.
+        """
+        self.original_source = self.source
+        if self.source_groups is None:
+            with span("getColumnGroups", table="source"):
+                self.source, self.source_identical_columns = getColumnGroups(self.source)
+            self.constant_columns = getConstantColumns(self.source)
+        else:
+            self.source_identical_columns, self.constant_columns = self.source_groups
+            duplicate_columns = {col for cols in self.source_identical_columns.values() for col in cols[1:]}
+            self.source = self.source.loc[:,[col for col in self.source.columns if col not in duplicate_columns]]
+        
+    def __getattr__(self, name):
+        model_class = ModelManager.MODELS.get(name)
+        if model_class is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        with ModelManager.models_lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = model_class(model_name=self.model_name, 
+                                                  openai_api_key=self.openai_api_key, 
+                                                  openai_api_base=self.openai_api_base)
+        return self.__dict__[name]
+            
     @property
     def iterCount(self):
         if self.SOURCE_ROW_PERIOD is not None:
@@ -490,8 +783,14 @@ class ModelManager:
         
     
     def setTables(self, source, target):
+        self.cancelSpeculation()
         self.source = source
         self.target = target
+        self.original_target = target
+        self.value_maps = {}                    # the distinct values of the previous source are not complete for the new one
+        self.plan = None
+        self.example_row = None
+        self.confirmed_row = None
         self.target.fillna("",inplace=True)
         
         # Convert all Timestamp columns to string
@@ -500,6 +799,9 @@ class ModelManager:
         for col in self.source.select_dtypes(include=["datetime"]).columns:
             self.source[col] = self.source[col].astype(str)
         
+        if self.source is not None:
+            self.groupSourceColumns()
+        
         if self.source is not None:
             self.SOURCE_ROW_PERIOD = max(1, self.CELL_LIMIT // self.source.shape[1])
         else:
@@ -507,7 +809,8 @@ class ModelManager:
             
         if self.target is not None:
             self.original_columns = self.target.columns
-            self.target, self.identical_columns = getColumnGroups(self.target)
+            with span("getColumnGroups", table="target"):
+                self.target, self.identical_columns = getColumnGroups(self.target)
         
     def getConfirmationMessage_old(self):
         self.examples, self.target_columns = getExamples(self.target,
@@ -525,33 +828,117 @@ class ModelManager:
                                                    array2=transformed_source_first_row_df)
         return self.mappings
     
-    def getConfirmationMessage(self):           
-        self.examples, self.target_columns = getExamples(self.target)
-        
-        self.source_first_row_str = getRow(self.source,0,self.target.shape[0])
-        self.transformed_source_first_row_json = self.row_model(examples=self.examples, columns=self.target_columns, row=self.source_first_row_str)
-        reformatted_row_json = self.cell_model(table1=self.transformed_source_first_row_json,
-                                               table2=prepareDFForCell(self.target,0),
-                                               columns=self.target_columns)
-        for col in self.target_columns:
-            if not self.transformed_source_first_row_json.get(col):
-                reformatted_row_json[col] = ""
-                
-        """reformatted_row_json = self.refiner_model(source_json=self.source.iloc[0].to_dict(),
-                                              target_json=self.target.iloc[-1].to_dict(),
-                                              intermediate_json = reformatted_row_json)"""
-                
-        transformed_df = dict2row(reformatted_row_json)
-        for k,cols in self.identical_columns.items():
-            for col in cols:
-                if col not in transformed_df.columns:
-                    transformed_df[col] = transformed_df[k]
-        self.transformed_df = transformed_df[self.original_columns]
-        row = getRowDF(self.source,0)
+    def getFingerprint(self):
+        return getSchemaFingerprint(self.original_source, self.original_target, api_base=getApiBase(self.openai_api_base))
+    
+    def getExampleSourceRow(self):
+        """The source row (with all source columns) which the confirmed first row was made from.
+        """
+        if self.example_row is None:
+            return getRowDF(self.original_source,0)
+        return self.example_row
+    
+    def getExampleRow(self):
+        return self.getExampleSourceRow()[self.source.columns].reset_index(drop=True)
+    
+    def getKeptColumn(self, col):
+        """The column of the source kept for a source column, which is itself unless it is a duplicate of another column.
+        """
+        for kept_col, cols in self.source_identical_columns.items():
+            if col in cols:
+                return kept_col
+        return col
+    
+    def getKeptProgram(self, program):
+        """The compiled program (see src/transforms.py) reading the kept source columns.
+        """
+        return {k:self.getKeptColumn(v) if k in ("column", "other_column") else v for k,v in program.items()}
+    
+    def applyPlan(self, plan):
+        """Uses a saved mapping plan instead of the confirmation models. Returns the confirmation message of the plan.
+        """
+        self.plan = plan
+        self.examples = plan.get("examples")
+        self.target_columns = plan.get("example_columns")
+        # the columns of the plan might be duplicates of other columns in this source
+        self.lineage = {k:list(dict.fromkeys(self.getKeptColumn(col) for col in cols)) for k, cols in plan.get("lineage", {}).items()}
+        self.example_row = pd.DataFrame([[plan["first_source_row"].get(str(col), "") for col in self.original_source.columns]],
+                                        columns=self.original_source.columns)
+        self.transformed_df = pd.DataFrame([[plan["first_row"].get(str(col), "") for col in self.original_columns]],
+                                           columns=self.original_columns)
+        self.stage = 1
         return {
-            "previous":row,
+            "previous":self.example_row,
             "after":self.transformed_df
         }
+    
+    def getPlannedConfirmation(self):
+        """Returns the confirmation message of the plan saved for the schemas of the tables, or None if there is none.
+        """
+        if self.plans is None:
+            return None
+        plan = self.plans.get(self.getFingerprint())
+        if plan is None:
+            return None
+        print("The saved mapping plan of the same schemas has been loaded.")
+        return self.applyPlan(plan)
+    
+    def getIntermediateRow(self):
+        """The first source row with the target columns as keys and the raw source values as values.
+        The target columns matched locally take the values of their source columns and only the rest is asked to the RowModel.
+        """
+        with span("matchColumns"):
+            self.column_matches = matchColumns(self.source, self.target, self.source_identical_columns) if self.column_matching else {}
+        remaining_columns = [col for col in self.target.columns if col not in self.column_matches]
+        self.target_columns = list(self.target.columns)
+        self.examples = ""
+        model_row = {}
+        if remaining_columns:
+            with span("getExamples"):
+                self.examples, columns = getExamples(self.target[remaining_columns])
+                self.source_first_row_str = getRow(self.source,0,len(remaining_columns))
+            model_row = self.row_model(examples=self.examples, columns=columns, row=self.source_first_row_str)
+        first_row = self.source.iloc[0]
+        return {col:cellToString(first_row[self.column_matches[col][0]]) if col in self.column_matches else model_row.get(col, "")
+                for col in self.target_columns}
+    
+    def getConfirmationMessage(self):
+        with useStage("confirmation"), traceStage("getConfirmationMessage"):
+            # a source of an already confirmed schema goes straight to getTable
+            with span("getPlannedConfirmation"):
+                confirmation = self.getPlannedConfirmation()
+            if confirmation is not None:
+                return confirmation
+        
+            self.transformed_source_first_row_json = self.getIntermediateRow()
+            with span("getLineageFromRow"):
+                self.lineage = getLineageFromRow(getRowDF(self.source,0), self.transformed_source_first_row_json)
+            with span("prepareDFForCell"):
+                table2 = prepareDFForCell(self.target,0)
+            reformatted_row_json = self.cell_model(table1=self.transformed_source_first_row_json,
+                                                   table2=table2,
+                                                   columns=self.target_columns)
+            for col in self.target_columns:
+                if not self.transformed_source_first_row_json.get(col):
+                    reformatted_row_json[col] = ""
+                
+            """reformatted_row_json = self.refiner_model(source_json=self.source.iloc[0].to_dict(),
+                                                  target_json=self.target.iloc[-1].to_dict(),
+                                                  intermediate_json = reformatted_row_json)"""
+                
+            with span("dict2row"):
+                transformed_df = dict2row(reformatted_row_json)
+            with span("identical columns"):
+                for k,cols in self.identical_columns.items():
+                    for col in cols:
+                        if col not in transformed_df.columns:
+                            transformed_df[col] = transformed_df[k]
+            self.transformed_df = transformed_df[self.original_columns]
+            row = getRowDF(self.original_source,0)
+            return {
+                "previous":row,
+                "after":self.transformed_df
+            }
         
     def getConfirmationMessageV2(self):
         try:
@@ -566,6 +953,7 @@ class ModelManager:
         
         self.source_first_row_str = getRow(self.source,0)
         self.transformed_source_first_row_json = self.row_model(examples=self.examples, columns=self.target_columns, row=self.source_first_row_str)
+        self.lineage = getLineageFromRow(getRowDF(self.source,0), self.transformed_source_first_row_json)
         table1 = {str(k):self.transformed_source_first_row_json.get(self.target.columns[k],'') for k in range(self.target.shape[1])}
         reformatted_row_json_index_based = self.cell_model_v2(table1=table1,
                                                   table2=prepareDFForCellV2(self.target,1,self.CELL_MODEL_EXAMPLES_COUNT),
@@ -588,7 +976,7 @@ class ModelManager:
                 if col not in transformed_df.columns:
                     transformed_df[col] = transformed_df[k]
         self.transformed_df = transformed_df[self.original_columns]
-        row = getRowDF(self.source,0)
+        row = getRowDF(self.original_source,0)
         return {
             "previous":row,
             "after":self.transformed_df
@@ -640,6 +1028,7 @@ JSON:{row}
         
         self.source_first_row_str = self.getRow(example_paragraph=example_paragraph, example_json=example_json)
         self.transformed_source_first_row_json = self.row_model(examples=self.examples, columns=self.target_columns, row=self.source_first_row_str)
+        self.lineage = {reverse_column_mapping.get(k,k):v for k,v in getLineageFromRow(getRowDF(self.source,0), self.transformed_source_first_row_json).items()}
         
         patterns = self.target_table_pattern_finder_model(examples=self.prepareDFForCell(1))
         reformatted_row_json = self.target_table_pattern_applier_model(patterns=patterns, json=self.transformed_source_first_row_json)
@@ -656,7 +1045,7 @@ JSON:{row}
                 if col not in transformed_df.columns:
                     transformed_df[col] = transformed_df[k]
         self.transformed_df = transformed_df[self.original_columns]
-        row = getRowDF(self.source,0)
+        row = getRowDF(self.original_source,0)
         return {
             "previous":row,
             "after":self.transformed_df
@@ -693,55 +1082,634 @@ JSON:{row}
 
         return self.mappings
     
-    def getTableWithFinetunedModel(self):
-        examples = self.target.iloc[:3].to_dict()
-        examples_str = json.dumps(examples)
-        rows = []
-        for i in range(self.source.shape[0]):
-            row = self.source.iloc[i].to_dict()
-            row = json.dumps(row)
-            result = self.finetuned_model(examples_str=examples_str,
-                                          source_str=row)
-            rows.append(result)
-            yield i, int(100*i/self.source.shape[0])
+    def applyFinetunedRow(self, row_index, examples_str):
+        row = json.dumps(self.source.iloc[row_index].to_dict())
+        result = self.finetuned_model(examples_str=examples_str,
+                                      source_str=row)
+        return {row_index:result if isinstance(result, dict) else {}}
+    
+    def applyFinetunedBatch(self, row_indices, examples_str):
+        """Transforms the rows with a single request and re-requests the rows missing in the result with exponential backoff.
+        The rows still missing after the retries are left empty and recorded in failed_rows.
+        """
+        results = {}
+        missing_rows = list(row_indices)
+        for attempt in range(args.APPLIER_MAX_RETRIES + 1):
+            if attempt > 0:
+                time.sleep(args.APPLIER_BACKOFF_SECONDS * 2**(attempt - 1))
+            rows = json.dumps({str(i):self.source.iloc[i].to_dict() for i in missing_rows}, default=str)
+            res = self.finetuned_batch_model(use_cache=attempt == 0,
+                                             examples_str=examples_str,
+                                             source_str=rows)
+            results.update({i:res[i] for i in missing_rows if i in res})
+            missing_rows = [i for i in missing_rows if i not in results]
+            if not missing_rows:
+                break
+        if missing_rows:
+            print(f"{len(missing_rows)} rows could not be generated between rows {row_indices[0]} and {row_indices[-1] + 1}")
+            with self.failed_rows_lock:
+                self.failed_rows.extend(missing_rows)
+        return results
+    
+    def getTableWithFinetunedModel(self, batch_size=args.FINETUNED_BATCH_SIZE):
+        """With batch_size > 1, that many rows are sent in each request (FinetunedBatchModel), otherwise one row per request.
+        The requests run concurrently and the progress reports the number of finished rows.
+        """
+        with traceStage("getTableWithFinetunedModel", rows=self.source.shape[0]):
+            examples = self.target.iloc[:3].to_dict()
+            examples_str = json.dumps(examples)
+            row_count = self.source.shape[0]
+            self.failed_rows = []
+            results = {}
+            executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            try:
+                if batch_size > 1:
+                    futures = [(min(start_index + batch_size, row_count), 
+                                executor.submit(runInStage, "finetuned", self.applyFinetunedBatch, 
+                                                list(range(start_index, min(start_index + batch_size, row_count))), 
+                                                examples_str))
+                               for start_index in range(0, row_count, batch_size)]
+                else:
+                    futures = [(i + 1, executor.submit(runInStage, "finetuned", self.applyFinetunedRow, i, examples_str)) for i in range(row_count)]
+                for end_index, future in futures:
+                    results.update(future.result())
+                    yield end_index, min(99, int(100*end_index/row_count))
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
             
-        table = pd.DataFrame(rows)
-        for k,cols in self.identical_columns.items():
-            for col in cols:
-                if col not in table.columns:
-                    table[col] = table[k]
-        table.fillna("",inplace=True)
-        yield table[self.original_columns], 100
+            table = pd.DataFrame([results.get(i, {}) for i in range(row_count)]).reindex(columns=self.target.columns)
+            table = self.snapValues(table)
+            for k,cols in self.identical_columns.items():
+                for col in cols:
+                    if col not in table.columns:
+                        table[col] = table[k]
+            table.fillna("",inplace=True)
+            yield table[self.original_columns], 100
             
         
+    def snapValues(self, table, confirmed_row=None):
+        """Snaps the cells of the closed-vocabulary target columns to their nearest allowed value and counts them in snapped_cells.
+        """
+        self.snapped_cells = {}
+        if not self.snap_values:
+            return table
+        table, self.snapped_cells = ValueIndex(self.target, confirmed_row).snap(table)
+        if self.snapped_cells:
+            print(f"{sum(self.snapped_cells.values())} cells have been snapped to the allowed values: {self.snapped_cells}")
+        return table
+    
+    def getChunkRanges(self, source_json=None, target_json=None, source=None):
+        """Row ranges of the applier requests over source (applier_source by default), packed up to the token budget.
+        """
+        source = self.applier_source if source is None else source
+        if not self.token_packing or target_json is None:
+            return [(start_index, min(start_index + self.SOURCE_ROW_PERIOD, source.shape[0]))
+                    for start_index in range(0,source.shape[0],self.SOURCE_ROW_PERIOD)]
+        
+        model_name = self.applier_model.model_name
+        wire_format = self.applier_model.wire_format
+        prompt = self.applier_model.chain.prompt.format(**self.applier_model.getInputs(source_json, target_json, 
+                                                                                       source.iloc[:0]))
+        fixed_input_tokens = countTokens(prompt, model_name)
+        fixed_output_tokens = countTokens(wire_format.dumpOutput(pd.DataFrame(columns=list(target_json))), model_name)
+        row_input_tokens = wire_format.getRowTokens(source, model_name)
+        # the completion of a row is expected to grow with its input, starting from the confirmed first row
+        first_row_output_tokens = wire_format.getOutputRowTokens(pd.DataFrame(target_json), model_name)[0]
+        row_output_tokens = [math.ceil(first_row_output_tokens * tokens / row_input_tokens[0]) for tokens in row_input_tokens]
+        return packRows(row_input_tokens, row_output_tokens, 
+                        fixed_input_tokens, fixed_output_tokens, 
+                        model_name, self.token_budget)
+    
+    def getApplierColumns(self, target_json):
+        """Source columns the ApplierModel needs for the target columns of target_json: the ones their confirmed cells are
+        made of (see getVerifiedLineage). Every source column is needed if the inputs of a column are unknown.
+        """
+        columns = list(self.source.columns)
+        if not self.prune_sources:
+            return columns
+        used = set()
+        for col in target_json:
+            source_cols = self.verified_lineage.get(col)
+            if source_cols is None:
+                # e.g. the confirmed cell combines several source cells or was typed by the user
+                return columns
+            used.update(source_cols)
+        used_columns = [col for col in columns if col in used]
+        if all(col in self.constant_columns for col in used_columns):
+            return columns
+        return used_columns
+    
+    def getApplierSource(self, target_json):
+        """The source table of the applier requests, without the unused columns and, unless a plan is applied, the constant ones.
+        """
+        # the example row of a plan comes from another file, so the constant cells of this one have to be sent
+        constant_columns = self.constant_columns if self.plan is None else []
+        return self.source[[col for col in self.getApplierColumns(target_json) if col not in constant_columns]]
+    
+    def getPassthroughTransforms(self, example_row, target_json):
+        """Copy programs (see src/transforms.py) of the target columns whose confirmed cell is the unchanged cell of their
+        only source column. Short or common cells are left to the LLM like in compileTransforms.
+        """
+        programs = {}
+        for col, values in target_json.items():
+            source_cols = self.verified_lineage.get(col, [])
+            cell = cellToString(values[0])
+            if len(source_cols) == 1 and cell and not isCommonValue(cell) and cell == cellToString(example_row[source_cols[0]].iloc[0]):
+                programs[col] = {"type":"affix", "column":source_cols[0], "case":"", "prefix":"", "suffix":""}
+        return programs
+    
+    def getEmptySourceMask(self, columns):
+        """Source row x target column mask of the cells whose source cells are all empty. Only the target columns whose
+        confirmed cell is known to be made of its source columns (see getVerifiedLineage) are masked.
+        """
+        lineage = {col:self.verified_lineage[col] for col in columns if col in self.verified_lineage} if self.gate_empty else {}
+        return getEmptySourceMask(self.source, lineage, columns)
+    
+    def gateEmptySources(self, table):
+        """Blanks the generated cells whose source cells are empty, like the empty cells of the RowModel result are kept
+        empty in the first row. The blanked cells are counted in gated_cells.
+        """
+        self.gated_cells = {}
+        if not self.gate_empty:
+            return table
+        gate = self.getEmptySourceMask([col for col in self.target.columns if col in table.columns])
+        for col in gate.columns:
+            mask = gate[col].values & (columnToString(table[col]).values != "")
+            if mask.any():
+                table[col] = table[col].astype(object).where(~mask, "")
+                self.gated_cells[col] = int(mask.sum())
+        if self.gated_cells:
+            print(f"{sum(self.gated_cells.values())} generated cells have been blanked since their source cells are empty: {self.gated_cells}")
+        return table
+    
+    def applyRows(self, rows, source_json, target_json, events=None, use_cache=True, source=None):
+        """Generates the target columns of target_json for the rows (positions in source, applier_source by default).
+        """
+        source = self.applier_source if source is None else source
+        with span("serialize rows", rows=len(rows)):
+            table = source.iloc[rows]
+            inputs = self.applier_model.getInputs(source_json, target_json, table)
+        return self.applier_model.generate(list(table.index), list(target_json), events, use_cache, **inputs)
+    
+    def compareWireFormats(self, source_json, target_json, names=None):
+        """Token cost of each wire format for a sample of the rows, cheapest first.
+        """
+        sample = self.getApplierSource(target_json).iloc[:args.WIRE_FORMAT_SAMPLE_ROWS]
+        return compareWireFormats(sample, source_json, target_json, self.applier_model.model_name, names)
+    
+    def getWireFormat(self, source_json, target_json):
+        if self.wire_format != "auto":
+            return self.wire_format
+        return self.compareWireFormats(source_json, target_json)[0]["format"]
+    
+    def getJobId(self):
+        if self.job_id is not None:
+            return self.job_id
+        fingerprint = hashlib.sha1(json.dumps([str(col) for col in self.original_columns]).encode("utf-8"))
+        fingerprint.update(getApiBase(self.openai_api_base).encode("utf-8"))
+        for col in self.original_source.columns:
+            fingerprint.update(str(col).encode("utf-8"))
+            fingerprint.update(getColumnFingerprint(self.original_source[col]).encode("utf-8"))
+        return fingerprint.hexdigest()
+    
+    def getPlanHash(self, source_json, target_json):
+        """Hash of everything the generated chunks depend on, so that stale checkpoints are never resumed.
+        """
+        plan = {"model":self.applier_model.model_name,
+                "api_base":self.applier_model.api_base,
+                "source_json":source_json,
+                "target_json":target_json,
+                "wire_format":self.applier_model.wire_format.name,
+                "columns":[str(col) for col in self.applier_source.columns],
+                "rows":self.requested_rows}
+        return hashlib.sha1(json.dumps(plan, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    
+    def applyChunk(self, start_index, end_index, source_json, target_json, events=None, run=None):
+        """Generates the chunk and re-requests only its missing or malformed rows with exponential backoff.
+        The rows still missing after the retries are left empty and recorded in the failed rows of the run.
+        run is the state of the generateTable call captured when the chunk was submitted (see getRun), so that a chunk
+        finishing after a newer run has started never uses or saves the state of the newer run.
+        """
+        with span("applyChunk", start=start_index, end=end_index):
+            rows = list(range(start_index, end_index))
+            if run["cancelled"] is not None and run["cancelled"].is_set():
+                return pd.DataFrame("", index=range(len(rows)), columns=list(target_json))
+            table, missing_rows = self.applyRows(rows, source_json, target_json, events, source=run["source"])
+            for attempt in range(args.APPLIER_MAX_RETRIES):
+                if not missing_rows or run["cancelled"] is not None and run["cancelled"].is_set():
+                    break
+                time.sleep(args.APPLIER_BACKOFF_SECONDS * 2**attempt)
+                retry_table, retry_missing_rows = self.applyRows([rows[i] for i in missing_rows], source_json, target_json, 
+                                                                 use_cache=False, source=run["source"])
+                recovered = [i for i in range(len(missing_rows)) if i not in set(retry_missing_rows)]
+                table.iloc[[missing_rows[i] for i in recovered]] = retry_table.iloc[recovered].values
+                missing_rows = [missing_rows[i] for i in retry_missing_rows]
+            if run["cancelled"] is not None and run["cancelled"].is_set():
+                # the result of a cancelled run is dropped, it is neither recorded nor saved
+                return table
+            if missing_rows:
+                print(f"{len(missing_rows)} rows could not be generated between rows {start_index} and {end_index}")
+                with self.failed_rows_lock:
+                    run["failed_rows"].extend(run["rows"][rows[i]] for i in missing_rows)
+            elif self.checkpoints is not None:
+                self.checkpoints.set(run["job_id"], run["plan_hash"], start_index, end_index, table)
+            return table
+    
+    def getRun(self, source_json, target_json, cancelled=None):
+        """State of a generateTable call given to its chunks: the applier rows, their source rows, the checkpoint keys,
+        the cancel event and the failed rows.
+        """
+        return {"source":self.applier_source,
+                "rows":self.requested_rows,
+                "job_id":self.getJobId(),
+                "plan_hash":self.getPlanHash(source_json, target_json),
+                "cancelled":cancelled,
+                "failed_rows":[]}
+        
+    def getLowCardinalityGroups(self, target_json):
+        """Target columns whose confirmed cell is made of a single low-cardinality source column only (see
+        getVerifiedLineage), grouped by that source column. A cell with text of any other column is never memoized.
+        """
+        groups = {}
+        for target_col in target_json:
+            source_cols = self.verified_lineage.get(target_col, [])
+            if len(source_cols) != 1 or source_cols[0] not in self.source.columns:
+                continue
+            groups.setdefault(source_cols[0], []).append(target_col)
+        return {source_col:target_cols for source_col, target_cols in groups.items() 
+                if source_col in self.constant_columns or isLowCardinality(self.source[source_col])}
+    
+    def mapDistinctValues(self, source_col, target_cols, target_json):
+        """Transforms each distinct value of the source column once and returns the table of results indexed by the value.
+        Returns None if the result cannot be aligned with the distinct values.
+        """
+        values = columnToString(self.source[source_col])
+        first_value = columnToString(self.getExampleRow()[source_col]).iloc[0]
+        if not first_value:
+            return None
+        target_json = {col:target_json[col] for col in target_cols}
+        key = (source_col, json.dumps(target_json, sort_keys=True, default=str))
+        if key in self.value_maps:
+            return self.value_maps[key]
+        
+        distinct_values = [value for value in values.unique() if value]
+        if set(distinct_values) <= {first_value}:
+            # constant column (or no other value in this batch chunk), the confirmed first row already has the answer
+            value_table = pd.DataFrame(columns=target_cols, index=distinct_values, dtype=object)
+        else:
+            table = pd.DataFrame({source_col:distinct_values})
+            inputs = self.applier_model.getInputs({source_col:{0:first_value}}, target_json, table)
+            value_table, missing_rows = self.applier_model.generate(list(table.index), target_cols, **inputs)
+            if missing_rows:
+                return None
+            value_table = pd.DataFrame({col:value_table[col].map(cellToString) for col in target_cols})
+            value_table.index = distinct_values
+        # the confirmed first row is the ground truth for its value
+        for col in target_cols:
+            value_table.loc[first_value, col] = cellToString(target_json[col][0])
+        self.value_maps[key] = value_table
+        return value_table
+        
+    def startSpeculation(self):
+        """Starts generating the table with the unedited first row in the background while the user reviews it.
+        getTable reuses the result and only generates the columns edited by the user again.
+        """
+        if not self.speculate or getattr(self, "transformed_df", None) is None:
+            return
+        self.cancelSpeculation()
+        speculation = {"row":self.transformed_df.copy(),
+                       "table":None,
+                       "progress":(0, 0),
+                       "failed_rows":[],
+                       "done":threading.Event(),
+                       "cancelled":threading.Event()}
+        
+        def run():
+            generator = self.generateTable(speculation["row"], speculative=True, cancelled=speculation["cancelled"])
+            try:
+                for result, percentage in generator:
+                    if speculation["cancelled"].is_set():
+                        break
+                    if percentage == 100:
+                        speculation["table"] = result
+                        speculation["failed_rows"] = list(self.failed_rows)
+                        break
+                    speculation["progress"] = (result, percentage)
+            except Exception as e:
+                print(f"The speculative table failed: {e}")
+            finally:
+                generator.close()
+                speculation["done"].set()
+                
+        speculation["thread"] = threading.Thread(target=run, name="speculation", daemon=True)
+        self.speculation = speculation
+        speculation["thread"].start()
+        
+    def cancelSpeculation(self):
+        """Stops the speculative table at its next chunk and waits for it, so that it does not use the tables any more.
+        """
+        speculation, self.speculation = self.speculation, None
+        if speculation is not None:
+            speculation["cancelled"].set()
+            speculation["thread"].join()
+            
+    def getEditedColumns(self, row, edited_row):
+        """Target columns whose cell in the edited row differs from the row.
+        """
+        return [col for col in self.target.columns 
+                if cellToString(row[col].iloc[0]) != cellToString(edited_row[col].iloc[0])]
+    
+    def isPlanned(self, gt_row):
+        """True if the confirmed row is the first row of the loaded plan.
+        """
+        confirmed_row = {str(col):cellToString(cell) for col, cell in gt_row.iloc[0].items()}
+        return self.plan is not None and confirmed_row == {k:cellToString(v) for k,v in self.plan["first_row"].items()}
+    
+    def saveConfirmedPlan(self, gt_row):
+        # the confirmed row is saved as the mapping plan of the schemas unless it is the row of the loaded plan
+        if self.plans is not None and not self.isPlanned(gt_row):
+            with span("savePlan"):
+                self.plans.set(self.getFingerprint(), getPlan(self, gt_row))
+    
     def getTable(self, gt_row=None):
+        """Yields (finished rows, percentage) and finally (table, 100).
+        If the table of the unedited first row has been generated in the background (see startSpeculation), it is used
+        as it is when the row has not been edited, otherwise only the edited columns are generated again.
+        """
         if gt_row is None:
-            gt_row = self.transformed_df   
-        first_row = gt_row.iloc[0]
-        json_str = first_row.to_json()
-        target_json = json.loads(json_str)
-        target_json = {k:[v] for k,v in target_json.items() if k in self.target.columns}    
+            gt_row = self.transformed_df
+        self.confirmed_row = gt_row
+        speculation, self.speculation = self.speculation, None
+        if speculation is not None:
+            # the background run is already on its way, it is awaited with its progress
+            while not speculation["done"].wait(0.1):
+                yield speculation["progress"]
+        if speculation is None or speculation["table"] is None:
+            yield from self.generateTable(gt_row)
+        else:
+            columns = self.getEditedColumns(speculation["row"], gt_row)
+            self.saveConfirmedPlan(gt_row)
+            if columns:
+                print(f"The speculative table is used except for the edited columns: {columns}")
+                yield from self.generateTable(gt_row, columns=columns, base=speculation["table"])
+                self.failed_rows = sorted(set(self.failed_rows) | set(speculation["failed_rows"]))
+            else:
+                self.failed_rows = speculation["failed_rows"]
+                yield speculation["table"], 100
+        self.stage = 2
+    
+    def getSourceColumnsOf(self, col):
+        """Source columns feeding the target column, from its compiled transform or the lineage of the first row.
+        """
+        if col in self.transforms:
+            columns = getLineage({col:self.transforms[col]})[col]
+        else:
+            columns = self.lineage.get(col, [])
+        return [source_col for source_col in columns if source_col in self.source.columns]
+    
+    def getCorrectedRows(self, table, edited_table):
+        """The cells edited by the user and the cells to be generated again, both as {target column: rows}.
+        The cells to be generated again are the ones of the rows whose source cells are similar to the source cells of an
+        edited row (see SimilarValueIndex), or whose generated cell is the same as the one edited if the column has no
+        known source columns. The confirmed first row is never generated again.
+        """
+        representatives = {col:k for k, cols in self.identical_columns.items() for col in cols}
+        edited = {}
+        for col, rows in getChangedCells(table, edited_table).items():
+            edited.setdefault(representatives.get(col, col), set()).update(rows)
+        source_index = SimilarValueIndex(self.source)
+        table_index = SimilarValueIndex(table, threshold=1)
+        # the first row of the table is the confirmed row unless the example row comes from a loaded plan
+        confirmed_rows = {0} if self.example_row is None else set()
+        gate = self.getEmptySourceMask(list(edited))
+        rerun = {}
+        for col, rows in edited.items():
+            source_cols = self.getSourceColumnsOf(col)
+            similar = set()
+            for row in rows:
+                if source_cols:
+                    similar |= source_index.getSimilarRows(row, source_cols)
+                else:
+                    similar |= table_index.getSimilarRows(row, [col])
+            # the cells whose source cells are empty stay empty
+            rerun[col] = sorted(row for row in similar - rows - confirmed_rows if not gate[col].values[row])
+        return edited, rerun
+    
+    def applyCorrections(self, table, edited_table, max_examples=args.CORRECTION_MAX_EXAMPLES):
+        """Re-applies the cells edited by the user in the final table to the similar rows of the same columns, with the
+        edited rows as extra examples next to the confirmed first row. The other cells are kept.
+        Yields (finished cells, percentage) and finally (table, 100).
+        """
+        self.corrected_cells = {}
+        result = edited_table.copy()
+        if self.confirmed_row is None:
+            print("The corrections can only be applied to a table generated from a confirmed first row")
+            yield result, 100
+            return
+        with useStage("correction"), traceStage("applyCorrections", rows=self.source.shape[0]):
+            with span("getCorrectedRows"):
+                edited, rerun = self.getCorrectedRows(table.reset_index(drop=True), edited_table.reset_index(drop=True))
+            # the columns having the same rows to be generated again are requested together
+            groups = {}
+            for col, rows in rerun.items():
+                if rows:
+                    groups.setdefault(tuple(rows), []).append(col)
+            
+            tasks = []
+            example_row = self.getExampleRow()
+            for rows, cols in groups.items():
+                example_rows = sorted(set().union(*(edited[col] for col in cols)))[:max_examples]
+                target_json = {col:[cellToString(self.confirmed_row[col].iloc[0])] + 
+                                   [cellToString(edited_table[col].iloc[row]) for row in example_rows]
+                               for col in cols}
+                source_columns = self.getApplierColumns(target_json)
+                source_json = pd.concat([example_row, self.source.iloc[example_rows]], ignore_index=True)[source_columns].to_dict()
+                source = self.getApplierSource(target_json)
+                # the rows are packed like the chunks of generateTable so that wide rows fit in the context window
+                for start_index, end_index in self.getChunkRanges(source_json, target_json, source.iloc[list(rows)]):
+                    tasks.append((list(rows[start_index:end_index]), source_json, target_json, source))
+            
+            total_cells = max(1, sum(len(task[0]) * len(task[2]) for task in tasks))
+            finished_cells = 0
+            failed_cells = 0
+            executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            try:
+                futures = [(rows, target_json, executor.submit(runInStage, "correction", self.applyRows, 
+                                                               rows, source_json, target_json, None, True, source))
+                           for rows, source_json, target_json, source in tasks]
+                for rows, target_json, future in futures:
+                    generated, missing_rows = future.result()
+                    # the rows which could not be generated keep their cells
+                    positions = [i for i in range(len(rows)) if i not in set(missing_rows)]
+                    failed_cells += len(missing_rows) * len(target_json)
+                    for col in target_json:
+                        values = generated[col].iloc[positions].map(cellToString).values
+                        for identical_col in self.identical_columns.get(col, [col]):
+                            result[identical_col] = result[identical_col].astype(object)
+                            result.iloc[[rows[i] for i in positions], result.columns.get_loc(identical_col)] = values
+                        self.corrected_cells[col] = self.corrected_cells.get(col, 0) + len(positions)
+                    finished_cells += len(rows) * len(target_json)
+                    yield finished_cells, min(99, int(100*finished_cells/total_cells))
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+            if failed_cells:
+                print(f"{failed_cells} cells could not be generated again and have been kept")
+            print(f"{sum(self.corrected_cells.values())} cells have been generated again with the corrections: {self.corrected_cells}")
+        yield result, 100
+    
+    def generateTable(self, gt_row, columns=None, base=None, speculative=False, cancelled=None):
+        """Generates the table with the confirmed first row. With columns, only those target columns are generated and the
+        others are taken from the base table. A speculative table does not save the mapping plan since the row is not
+        confirmed yet.
+        """
+        with traceStage("getTable", rows=self.source.shape[0], speculative=speculative):
+            first_row = gt_row.iloc[0]
+            json_str = first_row.to_json()
+            target_json = json.loads(json_str)
+            target_json = {k:[v] for k,v in target_json.items() if k in self.target.columns and (columns is None or k in columns)}
 
-        source_json = getRowDF(self.source,0).to_dict()
-        
-        combined_table = pd.DataFrame(columns=self.target.columns)
-        
-        for start_index in range(0,self.source.shape[0],self.SOURCE_ROW_PERIOD):
-            end_index = min(start_index + self.SOURCE_ROW_PERIOD, self.source.shape[0])       
-            #dataframe_json = {k:v for k,v in self.source.iloc[start_index:end_index].to_dict().items() if k in self.mappings}
-            dataframe_json = self.source.iloc[start_index:end_index].to_dict()
-            portion_table = self.applier_model(
-                source_json=source_json,
-                target_json=target_json,
-                dataframe_json=dataframe_json,
-            )
-            combined_table = pd.concat([combined_table, portion_table], ignore_index=True)
-            yield combined_table, min(99, int(100*end_index/self.source.shape[0]))     
-        # put identical columns here
-        for k,cols in self.identical_columns.items():
-            for col in cols:
-                if col not in combined_table.columns:
-                    combined_table[col] = combined_table[k]
-        combined_table.fillna("",inplace=True)
-        yield combined_table[self.original_columns], 100
-        self.stage = 2                
\ No newline at end of file
+            example_row = self.getExampleRow()
+            source_json = example_row.to_dict()
+            stage = "speculation" if speculative else "table"
+        
+            self.failed_rows = []
+        
+            planned = self.isPlanned(gt_row)
+            if not speculative:
+                self.saveConfirmedPlan(gt_row)
+        
+            target_row = {k:v[0] for k,v in target_json.items()}
+            # the columns which are simple functions of the source columns are computed without the LLM
+            self.transforms = {}
+            if self.compile_transforms:
+                if planned:
+                    # the transforms of the loaded plan, which might have been edited
+                    self.transforms = {k:self.getKeptProgram(v) for k,v in self.plan.get("transforms", {}).items() if k in target_json}
+                else:
+                    with span("compileTransforms"):
+                        self.transforms = compileTransforms(example_row, target_row, self.lineage)
+                target_json = {k:v for k,v in target_json.items() if k not in self.transforms}
+            self.verified_lineage = getVerifiedLineage(example_row, target_row, self.lineage, self.transforms)
+            if self.prune_sources:
+                # the columns which are copies of their only source column are passed through as they are
+                passthrough = self.getPassthroughTransforms(example_row, target_json)
+                self.transforms.update(passthrough)
+                target_json = {k:v for k,v in target_json.items() if k not in passthrough}
+        
+            # low-cardinality source columns are transformed once per distinct value and broadcast back
+            value_maps = {}
+            if self.memoize_values and self.source.shape[0] > 1:
+                groups = self.getLowCardinalityGroups(target_json)
+                with span("mapDistinctValues", columns=len(groups)), ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    futures = {source_col:executor.submit(runInStage, stage, self.mapDistinctValues, 
+                                                           source_col, target_cols, target_json)
+                               for source_col, target_cols in groups.items()}
+                for source_col, future in futures.items():
+                    value_map = future.result()
+                    if value_map is not None:
+                        value_maps[source_col] = value_map
+                memoized_columns = {col for value_map in value_maps.values() for col in value_map.columns}
+                target_json = {k:v for k,v in target_json.items() if k not in memoized_columns}
+        
+            # the chunks are collected in a list and concatenated once at the end, the progress reports the finished row count
+            portion_tables = []
+            completed_rows = 0
+            # the target cells whose source cells are empty are not requested, nor are the rows having only such cells
+            gate = self.getEmptySourceMask(list(target_json))
+            target_json = {k:v for k,v in target_json.items() if not gate[k].all()}
+            if target_json:
+                requested = ~gate[list(target_json)].all(axis=1)
+                self.requested_rows = requested.index[requested].tolist()
+            else:
+                self.requested_rows = []
+            # the source columns which do not feed the requested target columns are not sent
+            self.applier_source = self.getApplierSource(target_json).iloc[self.requested_rows]
+            source_json = {k:v for k,v in source_json.items() if k in self.getApplierColumns(target_json)}
+            if target_json:
+                with span("getWireFormat"):
+                    self.applier_model.setWireFormat(self.getWireFormat(source_json, target_json))
+        
+            # chunks are dispatched concurrently but collected in source order so that rows stay aligned
+            events = queue.Queue() if self.streaming else None
+            total_cells = max(1, len(self.requested_rows) * len(target_json))
+            generated_cells = 0
+            run = self.getRun(source_json, target_json, cancelled)
+            self.failed_rows = run["failed_rows"]
+            executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            try:
+                with span("getChunkRanges"):
+                    chunk_ranges = self.getChunkRanges(source_json, target_json) if target_json else []
+                futures = []
+                for start_index, end_index in chunk_ranges:
+                    # the chunks completed by a previous run of the same job are not requested again
+                    portion_table = None
+                    if self.checkpoints is not None:
+                        portion_table = self.checkpoints.get(run["job_id"], run["plan_hash"], start_index, end_index)
+                    if portion_table is None:
+                        future = executor.submit(runInStage, stage, self.applyChunk, 
+                                                 start_index, end_index, source_json, target_json, events, run)
+                    else:
+                        future = Future()
+                        future.set_result(portion_table)
+                        generated_cells += (end_index - start_index) * len(target_json)
+                    futures.append((end_index, future))
+                with span("collect chunks", chunks=len(futures)):
+                    for end_index, future in futures:
+                        # in streaming mode, report the generated cells of all running chunks until this one is finished
+                        while not future.done():
+                            if cancelled is not None and cancelled.is_set():
+                                # the pending chunks are cancelled by the executor shutdown below
+                                return
+                            if events is None:
+                                wait([future], timeout=0.1)
+                                continue
+                            try:
+                                generated_cells += events.get(timeout=0.1)
+                            except queue.Empty:
+                                continue
+                            yield completed_rows, min(99, int(100*generated_cells/total_cells))
+                        portion_table = future.result()
+                        portion_tables.append(portion_table)
+                        completed_rows = end_index
+                        yield completed_rows, min(99, int(100*max(end_index/max(1, len(self.requested_rows)), generated_cells/total_cells)))
+            finally:
+                # if the caller stops consuming (e.g. a Streamlit rerun), the pending chunks are not sent
+                executor.shutdown(wait=False, cancel_futures=True)
+            with span("concat"):
+                if portion_tables:
+                    combined_table = pd.concat(portion_tables, ignore_index=True)
+                    combined_table.index = self.requested_rows
+                else:
+                    combined_table = pd.DataFrame(columns=[col for col in self.target.columns if col in target_json])
+                # the rows which have not been requested are put back as empty rows
+                combined_table = combined_table.reindex(range(self.source.shape[0]))
+            if self.transforms:
+                with span("applyTransforms", columns=len(self.transforms)):
+                    compiled_table = applyTransforms(self.source, self.transforms).reset_index(drop=True)
+                    for col in compiled_table.columns:
+                        combined_table[col] = compiled_table[col]
+            with span("value maps"):
+                for source_col, value_map in value_maps.items():
+                    values = columnToString(self.source[source_col]).reset_index(drop=True)
+                    for col in value_map.columns:
+                        combined_table[col] = values.map(value_map[col]).fillna("")
+            if base is not None:
+                # the columns which are not generated again are taken from the base table
+                combined_table = combined_table.reindex(range(self.source.shape[0]))
+                for col in self.target.columns:
+                    if col not in combined_table.columns:
+                        combined_table[col] = base[col].values
+            with span("gateEmptySources"):
+                combined_table = self.gateEmptySources(combined_table)
+            with span("snapValues"):
+                combined_table = self.snapValues(combined_table, gt_row)
+            # put identical columns here
+            with span("identical columns"):
+                for k,cols in self.identical_columns.items():
+                    for col in cols:
+                        if col not in combined_table.columns:
+                            combined_table[col] = combined_table[k]
+                combined_table.fillna("",inplace=True)
+            if self.checkpoints is not None and not self.failed_rows:
+                self.checkpoints.clear(run["job_id"])
+            yield combined_table[self.original_columns], 100                
\ No newline at end of file
@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from src import args
+from src.transforms import cellToString, columnToString, parseDate, compileTransforms
+
+def getColumnProfile(column):
+    """Coarse kind of the values of the column: empty, number, date or text.
+    """
+    values = columnToString(column)
+    values = values[values != ""].head(args.PLAN_PROFILE_ROWS)
+    if values.empty:
+        return "empty"
+    if pd.to_numeric(values, errors="coerce").notna().all():
+        return "number"
+    if all(parseDate(value)[0] is not None for value in values):
+        return "date"
+    return "text"
+
+def getSchemaFingerprint(source, target, profile=args.PLAN_PROFILE, api_base=""):
+    """Fingerprint of the source and target schemas (column names, and the kinds of their values if profile is True)
+    and of the backend (see getApiBase in src/cache.py) under which a mapping plan is saved and found again.
+    """
+    schema = {"api_base":api_base,
+              "source":[str(col) for col in source.columns],
+              "target":[str(col) for col in target.columns]}
+    if profile:
+        schema["source_profile"] = [getColumnProfile(source[col]) for col in source.columns]
+        schema["target_profile"] = [getColumnProfile(target[col]) for col in target.columns]
+    return hashlib.sha256(json.dumps(schema).encode("utf-8")).hexdigest()
+
+def getPlan(manager, confirmed_row=None):
+    """The mapping plan of a confirmed first row: everything getTable needs to transform a source of the same schema
+    without the confirmation models.
+    """
+    if confirmed_row is None:
+        confirmed_row = manager.transformed_df
+    first_source_row = manager.getExampleSourceRow().iloc[0]
+    first_row = {str(col):cellToString(cell) for col, cell in confirmed_row.iloc[0].items()}
+    transforms = compileTransforms(manager.getExampleRow(),
+                                   {col:cell for col, cell in first_row.items() if col in manager.target.columns},
+                                   manager.lineage)
+    return {"model":manager.model_name,
+            "fingerprint":manager.getFingerprint(),
+            "source_columns":[str(col) for col in manager.original_source.columns],
+            "target_columns":[str(col) for col in manager.original_columns],
+            "target_column_groups":{str(k):[str(col) for col in cols] for k, cols in manager.identical_columns.items()},
+            "examples":getattr(manager, "examples", None),
+            "example_columns":getattr(manager, "target_columns", None),
+            "first_source_row":{str(col):cellToString(cell) for col, cell in first_source_row.items()},
+            "first_row":first_row,
+            "transforms":transforms,
+            "lineage":manager.lineage}
+
+def savePlan(plan, path):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(plan, f, indent=4, ensure_ascii=False)
+
+def loadPlan(path):
+    with open(path) as f:
+        return json.load(f)
+
+class PlanStore:
+    """Mapping plans saved as JSON files named by their schema fingerprint, so that they can be reviewed and edited.
+    """
+    def __init__(self, folder=args.PLAN_CACHE_PATH):
+        self.folder = folder
+
+    def getPath(self, fingerprint):
+        return os.path.join(self.folder, f"{fingerprint}.json")
+
+    def get(self, fingerprint):
+        path = self.getPath(fingerprint)
+        if not os.path.exists(path):
+            return None
+        try:
+            return loadPlan(path)
+        except (OSError, ValueError):
+            print(f"The mapping plan {path} could not be read")
+            return None
+
+    def set(self, fingerprint, plan):
+        savePlan(plan, self.getPath(fingerprint))
+
+    def clear(self, fingerprint):
+        path = self.getPath(fingerprint)
+        if os.path.exists(path):
+            os.remove(path)
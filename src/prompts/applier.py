@@ -17,4 +17,27 @@ Source2 JSON:
 {dataframe_json}
 ################################
 Target2 JSON:
-"""
\ No newline at end of file
+"""
+
+# the compact wire formats (see src/wire_formats.py) write every table in the same format
+table_system_template = """
+You are helpful assistant that is really good at transferring one transformation seen to another.
+As you can see, there is transformation from Source1 table to Target1 table.
+It is so important to apply the same transformation to every row of Source2 table to get Target2 table.
+The tables are written in {format_description}.
+Write Target2 table in exactly the same format as Target1 table with one row for each row of Source2 table, in the same order.
+Do not write anything else. If a cell has no value, leave it empty.
+"""
+
+table_human_template = """
+Source1 table:
+{source_json}
+################################
+Target1 table:
+{target_json}
+################################
+Source2 table:
+{dataframe_json}
+################################
+Target2 table:
+"""
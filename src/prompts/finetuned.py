@@ -7,4 +7,16 @@ human_template = """Examples:
         
 Source JSON:
 {source_str}
-"""
\ No newline at end of file
+"""
+
+# several source rows keyed by their row ids, the model answers with the target rows under the same ids
+batch_system_template = """
+You are a helper assistant that can transform each row of the Source JSON rows by looking at the Examples and keep its row id
+"""
+
+batch_human_template = """Examples:
+{examples_str}
+        
+Source JSON rows:
+{source_str}
+"""
@@ -0,0 +1,149 @@
+import time
+import threading
+import openai
+from src import args
+from src.tokens import getModelValue
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+class RateLimiter:
+    """Token buckets for the requests per minute and the tokens per minute of a model, shared by every thread.
+    A request reserves its estimated tokens before it is sent and the reservation is corrected with the actual usage after.
+    A limit of 0 means no limit.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = requests_per_minute
+        self.available_tokens = tokens_per_minute
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+        self.waiting = 0                        # requests waiting for the limits (queue depth)
+        self.condition = threading.Condition()
+        self.counts = {"requests":0,
+                       "tokens":0,
+                       "waits":0,
+                       "wait_seconds":0.0,
+                       "max_wait_seconds":0.0,
+                       "rate_limited":0,
+                       "max_queue_depth":0}
+
+    def refill(self, now):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.requests_per_minute:
+            self.available_requests = min(self.requests_per_minute, self.available_requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self.available_tokens = min(self.tokens_per_minute, self.available_tokens + elapsed * self.tokens_per_minute / 60)
+
+    def getWaitTime(self, tokens, now):
+        """Seconds until the request fits into the limits, 0 if it fits now.
+        """
+        wait = self.paused_until - now
+        if self.requests_per_minute and self.available_requests < 1:
+            wait = max(wait, (1 - self.available_requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self.available_tokens < tokens:
+            wait = max(wait, (tokens - self.available_tokens) * 60 / self.tokens_per_minute)
+        return max(0, wait)
+
+    def acquire(self, tokens):
+        """Blocks until the request and its estimated tokens fit into the limits and reserves them.
+        Returns the seconds waited.
+        """
+        if self.tokens_per_minute:
+            # a request larger than the bucket is let through once the bucket is full
+            tokens = min(tokens, self.tokens_per_minute)
+        start = time.monotonic()
+        with self.condition:
+            self.waiting += 1
+            self.counts["max_queue_depth"] = max(self.counts["max_queue_depth"], self.waiting)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    wait = self.getWaitTime(tokens, now)
+                    if wait <= 0:
+                        break
+                    self.condition.wait(wait)
+            finally:
+                self.waiting -= 1
+            if self.requests_per_minute:
+                self.available_requests -= 1
+            if self.tokens_per_minute:
+                self.available_tokens -= tokens
+            waited = time.monotonic() - start
+            self.counts["requests"] += 1
+            self.counts["tokens"] += tokens
+            if waited > 0.001:
+                self.counts["waits"] += 1
+                self.counts["wait_seconds"] += waited
+                self.counts["max_wait_seconds"] = max(self.counts["max_wait_seconds"], waited)
+        return waited
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        """Corrects the reservation of a finished request with its actual token usage.
+        """
+        with self.condition:
+            if self.tokens_per_minute:
+                estimated_tokens = min(estimated_tokens, self.tokens_per_minute)
+                self.available_tokens += estimated_tokens - actual_tokens
+            self.counts["tokens"] += actual_tokens - estimated_tokens
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """Holds every request of the model back, e.g. for the Retry-After of a rate limited request.
+        """
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.counts["rate_limited"] += 1
+            self.condition.notify_all()
+
+    @property
+    def stats(self):
+        with self.condition:
+            stats = dict(self.counts)
+            stats["queue_depth"] = self.waiting
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 3)
+        return stats
+
+def getRateLimiter(model_name):
+    """Returns the limiter shared by every request of the model, or None if rate limiting is disabled.
+    """
+    if not args.RATE_LIMIT_ENABLED:
+        return None
+    with _limiters_lock:
+        if model_name not in _limiters:
+            requests_per_minute, tokens_per_minute = getModelValue(model_name, args.MODEL_RATE_LIMITS, args.DEFAULT_RATE_LIMITS)
+            _limiters[model_name] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _limiters[model_name]
+
+def getRateLimitStats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {model_name:limiter.stats for model_name, limiter in limiters.items()}
+
+def getRetryAfter(error):
+    headers = getattr(error, "headers", None) or {}
+    for key, value in headers.items():
+        if key.lower() == "retry-after":
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+def getRetryDelay(error, attempt):
+    """Seconds to wait before the request is retried, or None if the error is not transient.
+    """
+    if isinstance(error, openai.error.RateLimitError):
+        retry_after = getRetryAfter(error)
+        if retry_after is not None:
+            return retry_after
+    elif not isinstance(error, (openai.error.Timeout,
+                                openai.error.APIError,
+                                openai.error.APIConnectionError,
+                                openai.error.ServiceUnavailableError)):
+        return None
+    return args.RATE_LIMIT_BACKOFF_SECONDS * 2**attempt
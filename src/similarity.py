@@ -0,0 +1,84 @@
+import re
+import zlib
+import numpy as np
+from src import args
+from src.transforms import columnToString
+
+def getNameText(name):
+    """Lower case words of a column name, e.g. "PolicyDate" and "policy_date" become "policy date".
+    """
+    name = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(name))
+    return " ".join(re.split(r"[^0-9a-zA-Z]+", name)).strip().lower()
+
+def getShape(value):
+    """Pattern of a cell, e.g. "AB12345" becomes "AA99999" and "2023-05-01" becomes "9999-99-99".
+    """
+    return re.sub(r"[a-z]", "a", re.sub(r"[A-Z]", "A", re.sub(r"[0-9]", "9", value)))
+
+def getSample(column, count=args.COLUMN_MATCH_SAMPLE_CELLS):
+    values = columnToString(column)
+    return values[values != ""].head(count).tolist()
+
+def getNgrams(text, n=args.COLUMN_MATCH_NGRAM):
+    text = f" {text} "
+    return [text[i:i+n] for i in range(max(1, len(text) - n + 1))]
+
+def getFeatures(documents, features=args.COLUMN_MATCH_FEATURES):
+    """TF-IDF vectors (L2 normalized) of the hashed character n-grams of the documents, one row per document.
+    """
+    counts = np.zeros((len(documents), features))
+    for i, document in enumerate(documents):
+        indices = [zlib.crc32(ngram.encode("utf-8")) % features for ngram in document]
+        np.add.at(counts[i], indices, 1)
+    document_frequency = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    vectors = np.log1p(counts) * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def getSimilarity(source_documents, target_documents):
+    vectors = getFeatures(source_documents + target_documents)
+    return vectors[:len(source_documents)] @ vectors[len(source_documents):].T
+
+def getSimilarityMatrix(source, target, source_groups=None):
+    """m x n similarity of the source and target columns from their names and their cells (the cells themselves and
+    their shapes). source_groups maps a source column to its identical columns, whose names are also compared.
+    """
+    source_groups = source_groups or {}
+    source_columns = list(source.columns)
+    target_columns = list(target.columns)
+
+    # the name similarity of a source column is the best one among the names of its identical columns
+    names = [(i, name) for i, col in enumerate(source_columns) for name in source_groups.get(col, [col])]
+    name_similarity = getSimilarity([getNgrams(getNameText(name)) for _, name in names],
+                                    [getNgrams(getNameText(col)) for col in target_columns])
+    owners = np.array([i for i, _ in names])
+    best_name_similarity = np.full((len(source_columns), len(target_columns)), -1.0)
+    np.maximum.at(best_name_similarity, owners, name_similarity)
+
+    source_samples = [getSample(source[col]) for col in source_columns]
+    target_samples = [getSample(target[col]) for col in target_columns]
+    value_similarity = getSimilarity([[ngram for value in sample for ngram in getNgrams(value)] for sample in source_samples],
+                                     [[ngram for value in sample for ngram in getNgrams(value)] for sample in target_samples])
+    shape_similarity = getSimilarity([[getShape(value) for value in sample] for sample in source_samples],
+                                     [[getShape(value) for value in sample] for sample in target_samples])
+
+    name_weight, value_weight, shape_weight = args.COLUMN_MATCH_WEIGHTS
+    return (name_weight * best_name_similarity + value_weight * value_similarity + shape_weight * shape_similarity) \
+        / (name_weight + value_weight + shape_weight)
+
+def matchColumns(source, target, source_groups=None, threshold=args.COLUMN_MATCH_THRESHOLD, margin=args.COLUMN_MATCH_MARGIN):
+    """Returns {target column: (source column, score)} for the target columns whose best source column is confident:
+    its score is at least threshold and ahead of the second best one by at least margin.
+    """
+    if source.shape[1] == 0 or target.shape[1] == 0:
+        return {}
+    similarity = getSimilarityMatrix(source, target, source_groups)
+    order = np.argsort(-similarity, axis=0)
+    matches = {}
+    for j, target_col in enumerate(target.columns):
+        best = similarity[order[0, j], j]
+        second = similarity[order[1, j], j] if similarity.shape[0] > 1 else 0
+        if best >= threshold and best - second >= margin:
+            matches[target_col] = (source.columns[order[0, j]], round(float(best), 3))
+    return matches
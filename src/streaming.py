@@ -0,0 +1,106 @@
+import json
+import ast
+
+def parseValue(value_str):
+    value_str = value_str.strip()
+    try:
+        return json.loads(value_str)
+    except json.JSONDecodeError:
+        try:
+            return ast.literal_eval(value_str)
+        except (SyntaxError, ValueError):
+            return value_str
+
+class IncrementalJsonParser:
+    """Consumes a JSON (or Python dict) completion piece by piece while it is being generated.
+    As soon as a member of the top level container closes, it is returned as (key, value) for objects
+    or (index, value) for arrays, so the caller doesn't need to wait for the last token.
+    Like refineJson, everything before the first bracket is ignored.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.container = None       # '{' or '[' once the top level container is opened
+        self.quote = None           # the quote character of the string being read
+        self.escape = False
+        self.key_start = None
+        self.key = None
+        self.value_start = None
+        self.index = 0
+        self.finished = False
+
+    def feed(self, text):
+        self.buffer += text
+        items = []
+        while self.position < len(self.buffer) and not self.finished:
+            item = self.step(self.buffer[self.position])
+            if item is not None:
+                items.append(item)
+            self.position += 1
+        return items
+
+    def step(self, char):
+        if self.container is None:
+            if char in "{[":
+                self.container = char
+                self.depth = 1
+            return None
+
+        if self.quote is not None:
+            if self.escape:
+                self.escape = False
+            elif char == "\\":
+                self.escape = True
+            elif char == self.quote:
+                self.quote = None
+                if self.depth == 1 and self.key_start is not None:
+                    self.key = parseValue(self.buffer[self.key_start:self.position+1])
+                    self.key_start = None
+            return None
+
+        if self.depth == 1:
+            return self.stepTopLevel(char)
+
+        if char in "\"'":
+            self.quote = char
+        elif char in "{[":
+            self.depth += 1
+        elif char in "}]":
+            self.depth -= 1
+        return None
+
+    def stepTopLevel(self, char):
+        expecting_key = self.container == "{" and self.key is None
+        if char in "\"'":
+            self.quote = char
+            if expecting_key:
+                self.key_start = self.position
+            elif self.value_start is None:
+                self.value_start = self.position
+        elif char in "{[":
+            if self.value_start is None:
+                self.value_start = self.position
+            self.depth += 1
+        elif char in ",}]":
+            item = self.popItem()
+            if char != ",":
+                self.depth = 0
+                self.finished = True
+            return item
+        elif not char.isspace() and char != ":" and not expecting_key and self.value_start is None:
+            self.value_start = self.position
+        return None
+
+    def popItem(self):
+        if self.value_start is None:
+            return None
+        value = parseValue(self.buffer[self.value_start:self.position])
+        if self.container == "{":
+            item = (self.key, value)
+        else:
+            item = (self.index, value)
+            self.index += 1
+        self.key = None
+        self.value_start = None
+        return item
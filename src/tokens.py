@@ -0,0 +1,84 @@
+import json
+import threading
+from src import args
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+def getModelValue(model_name, values, default):
+    """Returns the value of the model. Dated and fine-tuned variants use the value of their base model.
+    """
+    if model_name in values:
+        return values[model_name]
+    for name in sorted(values, key=len, reverse=True):
+        if name in model_name:
+            return values[name]
+    return default
+
+def getModelLimits(model_name):
+    """Returns (context window, max completion tokens) of the model.
+    """
+    return getModelValue(model_name, args.MODEL_TOKEN_LIMITS, args.DEFAULT_TOKEN_LIMITS)
+
+def getEncoding(model_name):
+    """Returns the tiktoken encoding of the model or None if tiktoken or its encoding files are not available.
+    """
+    with _encodings_lock:
+        if model_name not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model_name] = tiktoken.encoding_for_model(model_name)
+                except KeyError:
+                    _encodings[model_name] = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _encodings[model_name] = None
+        return _encodings[model_name]
+
+def countTokens(text, model_name="gpt-3.5-turbo"):
+    encoding = getEncoding(model_name)
+    if encoding is None:
+        return len(text) // args.CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text))
+
+def countTokensBatch(texts, model_name="gpt-3.5-turbo"):
+    encoding = getEncoding(model_name)
+    if encoding is None:
+        return [len(text) // args.CHARS_PER_TOKEN + 1 for text in texts]
+    return [len(tokens) for tokens in encoding.encode_batch(texts)]
+
+def getRowTokens(table, model_name="gpt-3.5-turbo"):
+    """Token cost of each row once it is serialized as in table.to_dict(), where every cell is written as "index": value.
+    """
+    indices = [str(index) for index in table.index]
+    rows = [json.dumps(values, default=str) for values in table.values.tolist()]
+    costs = countTokensBatch(rows, model_name)
+    return [cost + table.shape[1] * (len(index) + args.CELL_OVERHEAD_TOKENS) for cost, index in zip(costs, indices)]
+
+def packRows(row_input_tokens, row_output_tokens, fixed_input_tokens, fixed_output_tokens, model_name, budget=None):
+    """Greedily packs consecutive rows into (start_index, end_index) chunks so that each request stays within the model's
+    context window (prompt + expected completion) and the completion within the model's completion limit.
+    Every chunk has at least one row.
+    """
+    context_window, max_output = getModelLimits(model_name)
+    if budget is not None:
+        context_window = budget
+    context_window = int(context_window * args.TOKEN_BUDGET_RATIO)
+    max_output = int(max_output * args.TOKEN_BUDGET_RATIO)
+
+    chunks = []
+    start_index = 0
+    total = fixed_input_tokens + fixed_output_tokens
+    output = fixed_output_tokens
+    for i, (input_tokens, output_tokens) in enumerate(zip(row_input_tokens, row_output_tokens)):
+        fits = total + input_tokens + output_tokens <= context_window and output + output_tokens <= max_output
+        if i > start_index and not fits:
+            chunks.append((start_index, i))
+            start_index = i
+            total = fixed_input_tokens + fixed_output_tokens
+            output = fixed_output_tokens
+        total += input_tokens + output_tokens
+        output += output_tokens
+    if start_index < len(row_input_tokens):
+        chunks.append((start_index, len(row_input_tokens)))
+    return chunks
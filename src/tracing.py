@@ -0,0 +1,173 @@
+"""Nested timing spans of the pipeline stages and an opt-in profiler per span.
+
+    MAPGPT_TRACE_PATH=trace.json streamlit run app.py           # Chrome trace, open it in https://ui.perfetto.dev or speedscope
+    MAPGPT_TRACE_PATH=trace.folded python -m src.main           # folded stacks for flamegraph.pl or speedscope
+    MAPGPT_PROFILE=getTable,snapValues python -m src.main       # cProfile (or pyinstrument) of the named spans
+
+The LLM calls are spans as well, so the local pandas work is visible next to the network time.
+The trace file is rewritten after every stage (getConfirmationMessage, getTable, getTableWithFinetunedModel).
+"""
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from src import args
+
+class Tracer:
+    """Collects the spans of every thread. Each thread has its own stack of open spans, so the spans of the worker
+    threads (e.g. applyChunk) are nested in their own track.
+    """
+    def __init__(self, path=args.TRACE_PATH, profile_spans=args.PROFILE_SPANS):
+        self.path = path                        # trace file, .folded for folded stacks, Chrome trace JSON otherwise
+        self.profile_spans = set(profile_spans) # names of the spans to be profiled, "*" profiles every stage
+        self.enabled = bool(path or self.profile_spans)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.events = deque(maxlen=args.TRACE_MAX_SPANS)
+        self.origin = time.perf_counter()
+        self.profile_count = 0
+
+    def enable(self, path=None):
+        self.path = path if path is not None else self.path
+        self.enabled = True
+
+    def getStack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+            self.local.profiling = False
+        return self.local.stack
+
+    @contextmanager
+    def span(self, name, category="local", stage=False, **attributes):
+        """Times the block as a span nested in the open span of the thread. A stage span is profiled if its name is in
+        profile_spans (or "*" is) and the trace file is written when it is closed.
+        """
+        if not self.enabled:
+            yield
+            return
+        stack = self.getStack()
+        stack.append(name)
+        profiler = self.startProfiler(name, stage)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            if profiler is not None:
+                self.stopProfiler(profiler, name)
+            path = tuple(stack)
+            stack.pop()
+            thread = threading.current_thread()
+            with self.lock:
+                self.events.append({"name":name,
+                                    "cat":category,
+                                    "ph":"X",
+                                    "ts":round((start - self.origin) * 1e6, 1),
+                                    "dur":round((end - start) * 1e6, 1),
+                                    "pid":os.getpid(),
+                                    "tid":thread.ident,
+                                    "thread":thread.name,
+                                    "stack":path,
+                                    "args":{k:str(v) for k,v in attributes.items()}})
+            if stage and self.path:
+                self.write(self.path)
+
+    def startProfiler(self, name, stage):
+        if name not in self.profile_spans and not (stage and "*" in self.profile_spans):
+            return None
+        if self.local.profiling:
+            # a single profiler per thread, the nested spans are already in it
+            return None
+        self.local.profiling = True
+        if args.PROFILER == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print("pyinstrument is not installed (pip install pyinstrument), cProfile is used instead")
+            else:
+                profiler = Profiler()
+                profiler.start()
+                return profiler
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stopProfiler(self, profiler, name):
+        self.local.profiling = False
+        with self.lock:
+            self.profile_count += 1
+            count = self.profile_count
+        os.makedirs(args.PROFILE_PATH, exist_ok=True)
+        path = os.path.join(args.PROFILE_PATH, f"{name}-{os.getpid()}-{count}")
+        if hasattr(profiler, "disable"):
+            profiler.disable()
+            profiler.dump_stats(f"{path}.prof")
+            print(f"The profile of {name} has been saved to {path}.prof")
+        else:
+            from pyinstrument.renderers import SpeedscopeRenderer
+            profiler.stop()
+            with open(f"{path}.speedscope.json", "w") as f:
+                f.write(profiler.output(renderer=SpeedscopeRenderer()))
+            print(f"The profile of {name} has been saved to {path}.speedscope.json")
+
+    def getChromeTrace(self):
+        """The spans in the Chrome trace event format.
+        """
+        with self.lock:
+            events = [{k:v for k,v in event.items() if k not in ("stack", "thread")} for event in self.events]
+            threads = {(event["pid"], event["tid"]):event["thread"] for event in self.events}
+        for (pid, tid), name in threads.items():
+            events.append({"name":"thread_name", "ph":"M", "pid":pid, "tid":tid, "args":{"name":name}})
+        return {"traceEvents":events, "displayTimeUnit":"ms"}
+
+    def getFoldedStacks(self):
+        """Self time of every span stack in microseconds, one "thread;span;span value" line per stack.
+        """
+        with self.lock:
+            events = list(self.events)
+        totals = {}
+        children = {}
+        for event in events:
+            # the worker threads of every executor are merged so that their stacks add up
+            thread = re.sub(r"^ThreadPoolExecutor-\d+_\d+$", "worker", event["thread"])
+            stack = (thread,) + event["stack"]
+            totals[stack] = totals.get(stack, 0) + event["dur"]
+            parent = stack[:-1]
+            children[parent] = children.get(parent, 0) + event["dur"]
+        lines = []
+        for stack, total in totals.items():
+            self_time = max(0, total - children.get(stack, 0))
+            lines.append(f"{';'.join(name.replace(';', ',') for name in stack)} {int(self_time)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if path.endswith(".folded"):
+            text = self.getFoldedStacks()
+        else:
+            text = json.dumps(self.getChromeTrace())
+        with open(path, "w") as f:
+            f.write(text)
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+
+_tracer = Tracer()
+
+def getTracer():
+    return _tracer
+
+def span(name, category="local", **attributes):
+    return _tracer.span(name, category, **attributes)
+
+def traceStage(name, **attributes):
+    """Span of a pipeline stage: it can be profiled and the trace file is written when it is finished.
+    """
+    return _tracer.span(name, "stage", stage=True, **attributes)
@@ -0,0 +1,174 @@
+import math
+from datetime import datetime
+import pandas as pd
+from src import args
+
+def cellToString(cell):
+    if cell is None or (isinstance(cell, float) and math.isnan(cell)):
+        return ""
+    if isinstance(cell, float) and cell.is_integer():
+        return str(int(cell))
+    return str(cell)
+
+def columnToString(column):
+    """Vectorized cellToString.
+    """
+    if pd.api.types.is_float_dtype(column):
+        non_empty = column.dropna()
+        if (non_empty == non_empty.round()).all():
+            column = column.astype("Int64")
+    return column.astype(object).where(column.notna(), "").astype(str)
+
+CASES = {
+    "":lambda column: column,
+    "upper":lambda column: column.str.upper(),
+    "lower":lambda column: column.str.lower(),
+    "title":lambda column: column.str.title(),
+}
+
+CASES_SCALAR = {
+    "":lambda cell: cell,
+    "upper":lambda cell: cell.upper(),
+    "lower":lambda cell: cell.lower(),
+    "title":lambda cell: cell.title(),
+}
+
+def parseDate(cell):
+    """Returns the date and its format, or (None, None) if the cell is not a date or is ambiguous (e.g. 01/02/2023).
+    """
+    parsed = []
+    for date_format in args.DATE_FORMATS:
+        try:
+            parsed.append((datetime.strptime(cell, date_format), date_format))
+        except ValueError:
+            continue
+    if not parsed or len({date for date, _ in parsed}) > 1:
+        return None, None
+    return parsed[0]
+
+def applyTransform(source, program):
+    """Runs a compiled program over the whole source table and returns the target column as strings.
+    Cells whose source cells are empty stay empty.
+    """
+    kind = program["type"]
+    if kind == "empty":
+        return pd.Series([""] * source.shape[0], index=source.index)
+
+    column = columnToString(source[program["column"]])
+    if kind == "affix":
+        res = program["prefix"] + CASES[program["case"]](column) + program["suffix"]
+    elif kind == "date":
+        dates = pd.to_datetime(column, format=program["source_format"], errors="coerce")
+        res = dates.dt.strftime(program["target_format"]).where(dates.notna(), column)
+    elif kind == "split":
+        res = CASES[program["case"]](column.str.split(program["separator"]).str[program["part"]].fillna(""))
+    elif kind == "concat":
+        other = columnToString(source[program["other_column"]])
+        both = (column != "") & (other != "")
+        res = CASES[program["case"]]((column + program["separator"] + other).where(both, column + other))
+        return res
+    else:
+        raise ValueError(f"Unknown transform type: {kind}")
+    return res.where(column != "", "")
+
+def getCandidates(source_row, target_cell):
+    """All programs that turn the source row into the target cell, in order of preference.
+    """
+    candidates = []
+    for col, cell in source_row.items():
+        if not cell:
+            continue
+        for case, function in CASES_SCALAR.items():
+            cased = function(cell)
+            if cased and cased in target_cell:
+                prefix, _, suffix = target_cell.partition(cased)
+                affix_length = len(prefix) + len(suffix)
+                # the source cell needs to dominate the target cell, otherwise "1" would explain "2023-01-01"
+                if affix_length <= args.MAX_AFFIX_LENGTH and affix_length < len(cased):
+                    candidates.append({"type":"affix", "column":col, "case":case, "prefix":prefix, "suffix":suffix})
+            for separator in args.SEPARATORS:
+                parts = cell.split(separator)
+                if len(parts) < 2:
+                    continue
+                for part in (0, -1):
+                    if parts[part] and function(parts[part]) == target_cell:
+                        candidates.append({"type":"split", "column":col, "case":case, "separator":separator, "part":part})
+        date, source_format = parseDate(cell)
+        if date is not None:
+            for target_format in args.DATE_FORMATS:
+                if target_format != source_format and date.strftime(target_format) == target_cell:
+                    candidates.append({"type":"date", "column":col, "source_format":source_format, "target_format":target_format})
+
+    for col, cell in source_row.items():
+        if not cell or not target_cell.startswith(cell):
+            continue
+        rest = target_cell[len(cell):]
+        for other_col, other_cell in source_row.items():
+            if other_col == col or not other_cell or not rest.endswith(other_cell):
+                continue
+            separator = rest[:len(rest)-len(other_cell)]
+            if len(separator) <= args.MAX_AFFIX_LENGTH and not any(c.isalnum() for c in separator):
+                candidates.append({"type":"concat", "column":col, "other_column":other_col, "case":"", "separator":separator})
+    return sorted(candidates, key=getRank)
+
+def getRank(program):
+    """Simpler programs are preferred: copy, case change, date, split, prefix/suffix and lastly concat.
+    """
+    if program["type"] == "affix":
+        affix_length = len(program["prefix"]) + len(program["suffix"])
+        if affix_length == 0:
+            return (0 if not program["case"] else 1, 0)
+        return (4, affix_length)
+    return ({"date":2, "split":3, "concat":5}[program["type"]], 0)
+
+def isCommonValue(cell):
+    """True for the short or common cells like numbers, "Yes" or "N/A" which match source cells by chance.
+    """
+    cell = cell.strip()
+    if len(cell) < args.COMPILE_MIN_LENGTH or cell.lower() in args.COMMON_VALUES:
+        return True
+    try:
+        float(cell.replace(",", ""))
+        return True
+    except ValueError:
+        return False
+
+def compileTransforms(source_row_df, target_row, lineage):
+    """Infers a deterministic program per target column from the confirmed first row pair.
+    source_row_df is the first source row as a single row DataFrame, target_row maps target columns to confirmed cells
+    and lineage maps target columns to the source columns feeding them (see getLineageFromRow in src/utils.py).
+    A column is compiled only if its best program reads only its lineage columns, is unambiguous (no other program of
+    the same rank explains the cell) and reproduces the confirmed cell. Columns without lineage, and short or common
+    cells which match source cells by chance, are left to the LLM.
+    """
+    source_row = {col:cellToString(cell) for col, cell in source_row_df.iloc[0].items()}
+    programs = {}
+    for target_col, target_cell in target_row.items():
+        target_cell = cellToString(target_cell)
+        lineage_cols = {str(col) for col in lineage.get(target_col, [])}
+        if not target_cell or not lineage_cols or isCommonValue(target_cell):
+            continue
+        lineage_row = {col:cell for col, cell in source_row.items() if str(col) in lineage_cols and not isCommonValue(cell)}
+        candidates = getCandidates(lineage_row, target_cell)
+        if not candidates:
+            continue
+        best = candidates[0]
+        equally_good = [candidate for candidate in candidates if getRank(candidate) == getRank(best)]
+        if any(candidate != best for candidate in equally_good):
+            continue
+        if applyTransform(source_row_df, best).iloc[0] != target_cell:
+            continue
+        programs[target_col] = best
+    return programs
+
+def applyTransforms(source, programs):
+    return pd.DataFrame({col:applyTransform(source, program) for col, program in programs.items()}, index=source.index)
+
+def getLineage(programs):
+    """Source columns feeding each compiled target column.
+    """
+    lineage = {}
+    for target_col, program in programs.items():
+        columns = [program[key] for key in ("column", "other_column") if key in program]
+        lineage[target_col] = columns
+    return lineage
@@ -1,9 +1,13 @@
+import re
 import pandas as pd
+import numpy as np
 import random
 import json
 import functools
 import operator
+import hashlib
 from src import args
+from src.transforms import columnToString, cellToString, parseDate, getLineage
 
 def preprocessJson(json_str):
     # Convert 'null' to empty string
@@ -19,31 +23,46 @@ def preprocessJson(json_str):
     
     return json_str
 
+def getCellHashes(column):
+    try:
+        return pd.util.hash_pandas_object(column, index=False)
+    except TypeError:
+        # unhashable cells such as lists
+        return pd.util.hash_pandas_object(column.astype(str), index=False)
+
+def getColumnFingerprint(column):
+    return hashlib.sha1(getCellHashes(column).values.tobytes()).hexdigest()
+
 def getColumnGroups(df):
+    """Finds the identical columns and returns the table without the duplicates (in the original column order)
+    and the groups {kept column: [kept column, duplicate columns...]}.
+    Columns are bucketed by the hash of their content so that only the columns in the same bucket are compared.
+    """
+    buckets = {}
+    for col in df.columns:
+        buckets.setdefault(getColumnFingerprint(df[col]), []).append(col)
+    
     identical_columns = {}
-    # Compare all pairs of columns
-    for col1 in df.columns:
-        for col2 in df.columns:
-            # Skip if the same column or if col2 is already in the dictionary
-            if col1 == col2 or col2 in identical_columns:
+    duplicate_columns = set()
+    for cols in buckets.values():
+        for i, col1 in enumerate(cols):
+            if col1 in duplicate_columns:
                 continue
+            for col2 in cols[i+1:]:
+                # hashes might collide so the content is compared inside the bucket
+                if col2 not in duplicate_columns and df[col1].equals(df[col2]):
+                    identical_columns.setdefault(col1, [col1]).append(col2)
+                    duplicate_columns.add(col2)
+    
+    remaining_columns = [col for col in df.columns if col not in duplicate_columns]
+    return df.loc[:,remaining_columns], identical_columns 
 
-            # Check if the columns have the same content
-            if df[col1].equals(df[col2]):
-                # If col1 is already in the dictionary, add col2 to the list of its identical columns
-                if col1 in identical_columns:
-                    identical_columns[col1].append(col2)
-                # Otherwise, initialize a new list with col1 and col2
-                else:
-                    identical_columns[col1] = [col1, col2]
-    
-    found_columns = set()
-    for cols in identical_columns.values():
-        found_columns |= set(cols)
-    remaining_columns = set(df.columns) - found_columns
-    all_columns = remaining_columns | set(identical_columns.keys())
-    all_columns = list(all_columns)
-    return df.loc[:,all_columns], identical_columns 
+def getConstantColumns(df):
+    """Columns having the same value in every row. A single row table has no constant columns.
+    """
+    if df.shape[0] < 2:
+        return []
+    return [col for col in df.columns if getCellHashes(df[col]).nunique() <= 1]
 
 def prepareDFForCell(table, index=-1,count=0):
     
@@ -133,6 +152,74 @@ def getMappingFromRowResult(res, df1, df2):
         
         
     
+def getLineageFromRow(source_row_df, intermediate_json):
+    """Source columns feeding each target column, found by matching the RowModel result (target columns with raw
+    source values) with the first source row. Target columns whose value is empty or not found have no source columns.
+    """
+    columns = {}
+    for col, cell in source_row_df.iloc[0].items():
+        cell = str(cell).strip()
+        if cell and cell != "nan":
+            columns.setdefault(cell, []).append(str(col))
+    lineage = {}
+    for target_col, cell in intermediate_json.items():
+        cell = str(cell).strip()
+        lineage[target_col] = columns.get(cell, []) if cell else []
+    return lineage
+
+def isRebuiltFrom(cell, source_cells):
+    """True if the cell can be made of the source cells: every word of it is in one of them (in any case and with any
+    separators), or it is the date of one of them in another format. E.g. "Gold" is made of "Gold Plan", but
+    "Ann Lee (20)" is not made of "Ann" alone.
+    """
+    cell = cellToString(cell).strip()
+    source_cells = [cellToString(source_cell).strip() for source_cell in source_cells]
+    date, _ = parseDate(cell)
+    if date is not None and any(parseDate(source_cell)[0] == date for source_cell in source_cells):
+        return True
+    words = re.findall(r"[0-9a-z]+", cell.lower())
+    texts = ["".join(re.findall(r"[0-9a-z]+", source_cell.lower())) for source_cell in source_cells]
+    return bool(words) and all(any(word in text for text in texts) for word in words)
+
+def getVerifiedLineage(source_row_df, target_row, lineage, programs):
+    """Source columns of the target columns whose confirmed cell is made of them only: the columns of its compiled
+    program (see src/transforms.py), or its lineage if the confirmed cell isRebuiltFrom the lineage cells.
+    The inputs of the other target columns are unknown, so they are not in the result.
+    """
+    source_row = source_row_df.iloc[0]
+    verified = {}
+    for target_col, cell in target_row.items():
+        if target_col in programs:
+            verified[target_col] = getLineage({target_col:programs[target_col]})[target_col]
+            continue
+        source_cols = [col for col in lineage.get(target_col, []) if col in source_row.index]
+        if source_cols and isRebuiltFrom(cell, [source_row[col] for col in source_cols]):
+            verified[target_col] = source_cols
+    return verified
+
+def getEmptySourceMask(source, lineage, columns):
+    """Source row x target column mask of the target cells whose source columns (lineage) are all empty in the row.
+    Target columns without source columns are never masked.
+    """
+    empty = {}
+    mask = {}
+    for target_col in columns:
+        source_cols = [col for col in lineage.get(target_col, []) if col in source.columns]
+        if not source_cols:
+            mask[target_col] = np.zeros(source.shape[0], dtype=bool)
+            continue
+        for col in source_cols:
+            if col not in empty:
+                empty[col] = (columnToString(source[col]).str.strip() == "").values
+        mask[target_col] = np.logical_and.reduce([empty[col] for col in source_cols])
+    return pd.DataFrame(mask, columns=columns)
+
+def isLowCardinality(column):
+    """True for columns like country, status or category with a few distinct values repeated across many rows.
+    """
+    distinct_count = column.nunique(dropna=True)
+    return distinct_count <= args.LOW_CARDINALITY_MAX_VALUES and distinct_count <= args.LOW_CARDINALITY_RATIO * len(column)
+
 def getTableArray(df):
     no_empty_str_cols = df.columns[~df.apply(lambda col: col.astype(str).eq('').any())]
     df = df[no_empty_str_cols] 
@@ -0,0 +1,303 @@
+import io
+import csv
+import json
+import ast
+import pandas as pd
+from src.streaming import IncrementalJsonParser
+from src.tokens import countTokens, countTokensBatch, getRowTokens
+
+MALFORMED = object()        # cell of a generated row which could not be parsed, the row is requested again
+
+def loadLine(line):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        try:
+            return ast.literal_eval(line)
+        except (SyntaxError, ValueError):
+            return None
+
+def getLines(text):
+    """Non-empty lines of the completion without markdown code fences.
+    """
+    return [line for line in text.splitlines() if line.strip() and not line.strip().startswith("```")]
+
+def getCells(table):
+    """The table with empty cells instead of NaN/None so that every format writes them the same way.
+    """
+    return table.astype(object).where(table.notna(), "")
+
+class WireFormat:
+    """Serializes the applier tables into the prompt and parses the generated table back.
+    The rows of Source1, Target1 and Source2 are written in the same format, and Target2 is expected in it as well.
+    """
+    name = ""
+    description = ""                    # explains the format to the model, it is put into the system prompt
+
+    def dumpTable(self, table):
+        raise NotImplementedError
+
+    def dumpOutput(self, table):
+        """The completion expected for the table.
+        """
+        return self.dumpTable(table)
+
+    def dumpInputs(self, source_json, target_json, table):
+        """Prompt variables of the applier for the confirmed example and the rows to be transformed.
+        """
+        return {"source_json":self.dumpTable(pd.DataFrame.from_dict(source_json)),
+                "target_json":self.dumpTable(pd.DataFrame(target_json)),
+                "dataframe_json":self.dumpTable(table),
+                "format_description":self.description}
+
+    def getRowTokens(self, table, model_name="gpt-3.5-turbo"):
+        """Token cost of each row of the table in this format.
+        """
+        return [tokens + 1 for tokens in countTokensBatch(self.getRowTexts(table), model_name)]
+
+    def getOutputRowTokens(self, table, model_name="gpt-3.5-turbo"):
+        """Token cost of each row of the table in the completion.
+        """
+        return self.getRowTokens(table, model_name)
+
+    def getRowTexts(self, table):
+        raise NotImplementedError
+
+    def readRows(self, text):
+        """Returns the header (or None if there is no header) and the rows of the text.
+        A row is the list of its cells or None if it is malformed.
+        """
+        raise NotImplementedError
+
+    def loadTable(self, text):
+        header, rows = self.readRows(text)
+        if header is None:
+            return pd.DataFrame()
+        return pd.DataFrame([row for row in rows if row is not None and len(row) == len(header)], columns=header)
+
+    def parse(self, text, columns):
+        """Returns the generated column arrays. Every cell of a malformed row is MALFORMED.
+        If the completion has no header, the columns are assumed to be in the requested order.
+        """
+        header, rows = self.readRows(text)
+        if header is None or sorted(map(str, header)) != sorted(map(str, columns)):
+            if header is not None:
+                # the first line is a row
+                rows = [header] + rows
+            header = list(columns)
+        header = [str(col) for col in header]
+        res = {col:[] for col in columns}
+        for row in rows:
+            valid = row is not None and len(row) == len(header)
+            cells = dict(zip(header, row)) if valid else {}
+            for col in columns:
+                res[col].append(cells.get(str(col), "") if valid else MALFORMED)
+        return res
+
+    def getStreamParser(self, columns):
+        return LineCounter(self, columns)
+
+class LineCounter:
+    """Counts the cells of the generated rows as the lines of the completion arrive. The first line is the header.
+    """
+    def __init__(self, wire_format, columns):
+        self.cell_count = len(columns)
+        self.buffer = ""
+        self.header_seen = False
+
+    def feed(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        counts = []
+        for line in getLines("\n".join(lines)):
+            if not self.header_seen:
+                self.header_seen = True
+                continue
+            counts.append(self.cell_count)
+        return counts
+
+class JsonFormat(WireFormat):
+    """The column oriented JSON of table.to_dict(), where every cell is written with its row index.
+    The completion is a JSON of column arrays.
+    """
+    name = "json"
+    description = "JSON of the columns"
+
+    def dumpTable(self, table):
+        return str(table.to_dict())
+
+    def dumpOutput(self, table):
+        return json.dumps(getCells(table).to_dict(orient="list"), default=str)
+
+    def dumpInputs(self, source_json, target_json, table):
+        # the dicts are rendered by the prompt template exactly as before the wire formats
+        return {"source_json":source_json,
+                "target_json":target_json,
+                "dataframe_json":table.to_dict()}
+
+    def getRowTokens(self, table, model_name="gpt-3.5-turbo"):
+        return getRowTokens(table, model_name)
+
+    def getOutputRowTokens(self, table, model_name="gpt-3.5-turbo"):
+        # the completion has column arrays, so the cells are written without their row index
+        rows = [json.dumps(row, default=str) for row in getCells(table).values.tolist()]
+        return [tokens + table.shape[1] for tokens in countTokensBatch(rows, model_name)]
+
+    def parse(self, text, columns):
+        if "{" not in text or "}" not in text:
+            return None
+        res = loadLine(text[text.find("{"):text.rfind("}") + 1])
+        if res is None:
+            print("Failed to decode input string")
+        return res
+
+    def getStreamParser(self, columns):
+        return JsonCounter()
+
+class JsonCounter:
+    """Counts the cells of the column arrays as they close, for the progress of the streamed completions.
+    """
+    def __init__(self):
+        self.parser = IncrementalJsonParser()
+
+    def feed(self, text):
+        return [len(values) if isinstance(values, (list, dict)) else 1 for _, values in self.parser.feed(text)]
+
+class DelimitedFormat(WireFormat):
+    """Header once, then one delimited line per row (CSV, TSV).
+    """
+    def __init__(self, name, delimiter, description):
+        self.name = name
+        self.delimiter = delimiter
+        self.description = description
+
+    def writeRows(self, rows):
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=self.delimiter, lineterminator="\n")
+        writer.writerows(rows)
+        return output.getvalue().rstrip("\n")
+
+    def dumpTable(self, table):
+        return self.writeRows([list(map(str, table.columns))] + getCells(table).values.tolist())
+
+    def getRowTexts(self, table):
+        return [self.writeRows([row]) for row in getCells(table).values.tolist()]
+
+    def readRows(self, text):
+        lines = getLines(text)
+        rows = list(csv.reader(lines, delimiter=self.delimiter, skipinitialspace=self.delimiter != "\t"))
+        if not rows:
+            return None, []
+        return [cell.strip() for cell in rows[0]], rows[1:]
+
+    def parse(self, text, columns):
+        # the lines before the header (e.g. "Here is the table:") are dropped
+        lines = getLines(text)
+        columns_line = [str(col) for col in columns]
+        for i, line in enumerate(lines):
+            row = next(csv.reader([line], delimiter=self.delimiter, skipinitialspace=self.delimiter != "\t"), [])
+            if sorted(cell.strip() for cell in row) == sorted(columns_line):
+                text = "\n".join(lines[i:])
+                break
+        else:
+            text = "\n".join([self.writeRows([columns_line])] + lines)
+        return super().parse(text, columns)
+
+class JsonLinesFormat(WireFormat):
+    """Header once as a JSON array of the column names, then one JSON array of cells per row.
+    """
+    name = "jsonl"
+    description = ("JSON lines: the first line is the JSON array of the column names, "
+                   "then every row is one line with the JSON array of its cells")
+
+    def dumpTable(self, table):
+        return "\n".join([json.dumps(list(map(str, table.columns)))] + self.getRowTexts(table))
+
+    def getRowTexts(self, table):
+        return [json.dumps(row, default=str) for row in getCells(table).values.tolist()]
+
+    def readRows(self, text):
+        header = None
+        rows = []
+        for line in getLines(text):
+            row = loadLine(line.strip().rstrip(","))
+            if not isinstance(row, list):
+                # prose lines are skipped, broken arrays are malformed rows
+                if line.strip().startswith("["):
+                    rows.append(None)
+                continue
+            if header is None and not rows:
+                header = row
+                continue
+            rows.append(row)
+        return header, rows
+
+class IndexedFormat(WireFormat):
+    """Like prepareDFForCellV2, the cells are keyed by the position of their column and the first line maps
+    the positions to the column names.
+    """
+    name = "indexed"
+    description = ("indexed JSON lines: the first line maps the column numbers to the column names, "
+                   "then every row is one line with the JSON object mapping the column numbers to its cells")
+
+    def dumpTable(self, table):
+        legend = json.dumps({i:str(col) for i, col in enumerate(table.columns)})
+        return "\n".join([legend] + self.getRowTexts(table))
+
+    def getRowTexts(self, table):
+        return [json.dumps({i:cell for i, cell in enumerate(row)}, default=str) for row in getCells(table).values.tolist()]
+
+    def readRows(self, text):
+        header = None
+        rows = []
+        for line in getLines(text):
+            row = loadLine(line.strip().rstrip(","))
+            if not isinstance(row, dict):
+                if line.strip().startswith("{"):
+                    rows.append(None)
+                continue
+            try:
+                row = {int(k):v for k,v in row.items()}
+            except (TypeError, ValueError):
+                rows.append(None)
+                continue
+            if header is None and not rows:
+                header = [row[i] for i in sorted(row)]
+                continue
+            width = len(header) if header is not None else max(row, default=-1) + 1
+            rows.append([row[i] for i in range(width)] if all(i in row for i in range(width)) else None)
+        return header, rows
+
+WIRE_FORMATS = {
+    "json":JsonFormat(),
+    "csv":DelimitedFormat("csv", ",", "CSV: the first line is the header with the column names, then every row is one line "
+                                      "with its cells separated by commas and quoted with double quotes if they contain a comma"),
+    "tsv":DelimitedFormat("tsv", "\t", "TSV: the first line is the header with the column names, then every row is one line "
+                                       "with its cells separated by tabs"),
+    "jsonl":JsonLinesFormat(),
+    "indexed":IndexedFormat(),
+}
+
+def getWireFormat(name):
+    if name not in WIRE_FORMATS:
+        raise ValueError(f"Unknown wire format: {name}, it should be one of {list(WIRE_FORMATS)}")
+    return WIRE_FORMATS[name]
+
+def compareWireFormats(table, source_json, target_json, model_name="gpt-3.5-turbo", names=None):
+    """Token cost of transforming the rows of the table in each format, cheapest first.
+    The completion is estimated by repeating the confirmed target row for every row.
+    """
+    row_count = max(1, table.shape[0])
+    expected = pd.DataFrame(target_json).iloc[[0] * row_count].reset_index(drop=True)
+    results = []
+    for name in names or WIRE_FORMATS:
+        wire_format = getWireFormat(name)
+        inputs = wire_format.dumpInputs(source_json, target_json, table)
+        input_tokens = sum(countTokens(str(inputs[key]), model_name) for key in ("source_json", "target_json", "dataframe_json"))
+        output_tokens = countTokens(wire_format.dumpOutput(expected), model_name)
+        results.append({"format":name,
+                        "input_tokens":input_tokens,
+                        "output_tokens":output_tokens,
+                        "total_tokens":input_tokens + output_tokens,
+                        "tokens_per_row":round((input_tokens + output_tokens) / row_count, 1)})
+    return sorted(results, key=lambda result: result["total_tokens"])
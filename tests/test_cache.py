@@ -0,0 +1,19 @@
+from src.cache import ResponseCache, getApiBase
+
+def test_key_depends_on_the_backend(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_BASE", raising=False)
+    messages = [("human", "hello")]
+    fake = ResponseCache.getKey("gpt-3.5-turbo", messages, 0, "http://127.0.0.1:8000/v1")
+    assert fake != ResponseCache.getKey("gpt-3.5-turbo", messages, 0, "")
+    assert ResponseCache.getKey("gpt-3.5-turbo", messages, 0, "") == ResponseCache.getKey("gpt-3.5-turbo", messages, 0, getApiBase())
+    # like the OpenAI client, OPENAI_API_BASE is used when no API base is given
+    monkeypatch.setenv("OPENAI_API_BASE", "http://127.0.0.1:8000/v1/")
+    assert ResponseCache.getKey("gpt-3.5-turbo", messages, 0, "") == fake
+
+def test_cached_response(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "responses.sqlite"), enabled=True)
+    key = ResponseCache.getKey("gpt-3.5-turbo", [("human", "hello")])
+    assert cache.get(key) is None
+    cache.set(key, "world")
+    assert cache.get(key) == "world"
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
@@ -0,0 +1,21 @@
+import pandas as pd
+from src.corrections import getChangedCells, SimilarValueIndex
+
+def test_changed_cells():
+    table = pd.DataFrame({"Plan":["Gold", "Silver", None], "Age":[1.0, 2.0, 3.0]})
+    edited = pd.DataFrame({"Plan":["Gold", "silver", ""], "Age":["1", "2", "4"]})
+    assert getChangedCells(table, edited) == {"Plan":[1], "Age":[2]}
+
+def test_similar_rows_have_similar_source_values():
+    source = pd.DataFrame({"plan":["Gold Plan", "Silver Plan", "gold-plan", "Gold Plans", "Bronze Plan", ""],
+                           "date":["05/01/2023", "05/04/2023", "05/01/2023", "05/01/2023", "05/01/2023", "05/01/2023"]})
+    index = SimilarValueIndex(source, threshold=0.7)
+    assert index.getSimilarRows(0, ["plan"]) == {0, 2, 3}
+    # every given column has to be similar
+    assert index.getSimilarRows(0, ["plan", "date"]) == {0, 2, 3}
+    assert index.getSimilarRows(1, ["date"]) == {1}
+    assert index.getSimilarRows(5, ["plan"]) == {5}
+
+def test_exact_values_only():
+    table = pd.DataFrame({"Plan":["GOLD", "Gold", "Golden", "GOLD "]})
+    assert SimilarValueIndex(table, threshold=1).getSimilarRows(0, ["Plan"]) == {0, 1, 3}
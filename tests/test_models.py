@@ -0,0 +1,29 @@
+from src.models import ApplierModel
+from src.wire_formats import MALFORMED
+
+def getModel():
+    return ApplierModel(openai_api_key="sk-test", openai_api_base="http://127.0.0.1:1/v1")
+
+def test_column_arrays_are_aligned_by_position():
+    table, missing_rows = getModel().validate({"Plan":["Gold", "Silver"], "Age":["1", "2", "3"]}, [10, 11, 12], ["Plan", "Age"])
+    assert table["Plan"].tolist() == ["Gold", "Silver", ""]
+    assert table["Age"].tolist() == ["1", "2", "3"]
+    assert missing_rows == [2]
+
+def test_dropped_row_label_is_missing():
+    res = {"Plan":{"10":"Gold", "12":"Bronze", "13":"Silver"}}
+    table, missing_rows = getModel().validate(res, [10, 11, 12, 13], ["Plan"])
+    assert table["Plan"].tolist() == ["Gold", "", "Bronze", "Silver"]
+    assert missing_rows == [1]
+
+def test_renumbered_rows_are_taken_in_order():
+    table, missing_rows = getModel().validate({"Plan":{0:"Gold", 1:"Bronze"}}, [10, 11], ["Plan"])
+    assert table["Plan"].tolist() == ["Gold", "Bronze"]
+    assert missing_rows == []
+
+def test_malformed_cells_and_undecoded_completion_are_missing():
+    table, missing_rows = getModel().validate({"Plan":["Gold", MALFORMED, ["x"], None]}, [0, 1, 2, 3], ["Plan", "Age"])
+    assert table["Plan"].tolist() == ["Gold", "", "", ""]
+    assert missing_rows == [0, 1, 2, 3]
+    table, missing_rows = getModel().validate("not json", [0, 1], ["Plan"])
+    assert missing_rows == [0, 1] and table.shape == (2, 1)
@@ -0,0 +1,24 @@
+from src.streaming import IncrementalJsonParser
+
+def feedPieces(text, size):
+    parser = IncrementalJsonParser()
+    items = []
+    for start in range(0, len(text), size):
+        items += parser.feed(text[start:start + size])
+    return items
+
+def test_columns_are_returned_as_they_close():
+    parser = IncrementalJsonParser()
+    assert parser.feed('Here it is: {"Name": ["Ann", "Bo') == []
+    assert parser.feed('b"], "Plan"') == [("Name", ["Ann", "Bob"])]
+    assert parser.feed(': {"0": "Gold, Silver"}}') == [("Plan", {"0":"Gold, Silver"})]
+    assert parser.feed(' trailing {"ignored": 1}') == []
+
+def test_any_piece_size_gives_the_same_items():
+    text = '{"a": ["x]", "y\\"z"], \'b\': [1, 2.5, null], "c": "plain"}'
+    expected = [("a", ["x]", 'y"z']), ("b", [1, 2.5, None]), ("c", "plain")]
+    for size in (1, 2, 7, len(text)):
+        assert feedPieces(text, size) == expected
+
+def test_top_level_array():
+    assert feedPieces('[{"a": 1}, [2, 3], "x"]', 3) == [(0, {"a":1}), (1, [2, 3]), (2, "x")]
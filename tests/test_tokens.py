@@ -0,0 +1,30 @@
+from src import args
+from src.tokens import packRows, getModelLimits
+
+def getBudget(tokens):
+    # a budget which leaves the given number of tokens after TOKEN_BUDGET_RATIO
+    return int(tokens / args.TOKEN_BUDGET_RATIO) + 1
+
+def test_rows_are_packed_up_to_the_budget():
+    chunks = packRows([10] * 10, [0] * 10, 20, 0, "gpt-3.5-turbo", budget=getBudget(50))
+    assert chunks == [(0, 3), (3, 6), (6, 9), (9, 10)]
+
+def test_chunks_cover_every_row_in_order():
+    row_tokens = [5, 40, 3, 3, 3, 25, 1]
+    chunks = packRows(row_tokens, row_tokens, 10, 10, "gpt-3.5-turbo", budget=getBudget(100))
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(row_tokens)
+    assert all(end == start for (_, end), (start, _) in zip(chunks, chunks[1:]))
+
+def test_a_row_larger_than_the_budget_gets_its_own_chunk():
+    assert packRows([5, 500, 5], [0, 0, 0], 0, 0, "gpt-3.5-turbo", budget=getBudget(100)) == [(0, 1), (1, 2), (2, 3)]
+
+def test_completion_limit():
+    _, max_output = getModelLimits("gpt-3.5-turbo")
+    output_tokens = int(max_output * args.TOKEN_BUDGET_RATIO) // 2
+    chunks = packRows([1] * 4, [output_tokens] * 4, 0, 0, "gpt-3.5-turbo", budget=10**9)
+    assert chunks == [(0, 2), (2, 4)]
+
+def test_dated_models_use_their_base_limits():
+    assert getModelLimits("gpt-4-0613") == getModelLimits("gpt-4")
+    assert getModelLimits("ft:gpt-3.5-turbo-1106:org::id") == getModelLimits("gpt-3.5-turbo-1106")
+    assert getModelLimits("unknown-model") == args.DEFAULT_TOKEN_LIMITS
@@ -0,0 +1,45 @@
+import pandas as pd
+from src.transforms import parseDate, compileTransforms, applyTransforms, isCommonValue
+
+def getRow(**cells):
+    return pd.DataFrame([cells])
+
+def test_copy_and_case_are_compiled():
+    programs = compileTransforms(getRow(name="Ann Lee", code="abcd"), {"Name":"Ann Lee", "Code":"ABCD"},
+                                 {"Name":["name"], "Code":["code"]})
+    assert programs["Name"] == {"type":"affix", "column":"name", "case":"", "prefix":"", "suffix":""}
+    assert programs["Code"]["case"] == "upper"
+
+def test_only_lineage_columns_are_used():
+    source = getRow(first="Ann Lee", second="Ann Lee", other="Bob Kim")
+    # both source columns explain the cell, the lineage decides
+    assert compileTransforms(source, {"Name":"Ann Lee"}, {"Name":["second"]})["Name"]["column"] == "second"
+    assert compileTransforms(source, {"Name":"Ann Lee"}, {"Name":["other"]}) == {}
+
+def test_ambiguous_program_is_rejected():
+    programs = compileTransforms(getRow(first="x123", second="x123"), {"Value":"x123"}, {"Value":["first", "second"]})
+    assert "Value" not in programs
+
+def test_columns_without_lineage_are_left_to_the_llm():
+    source = getRow(name="Ann Lee", note=None)
+    assert compileTransforms(source, {"Name":"Ann Lee", "Note":""}, {"Name":[], "Note":[]}) == {}
+
+def test_common_values_are_not_compiled():
+    source = getRow(id="1", qty="3", newsletter="Yes")
+    lineage = {"Quantity":["id"], "Active":["newsletter"]}
+    assert compileTransforms(source, {"Quantity":"1", "Active":"Yes"}, lineage) == {}
+    assert isCommonValue("1,250.5") and isCommonValue("N/A") and not isCommonValue("Gold")
+
+def test_date_is_reformatted():
+    source = getRow(joined="2023-05-17")
+    programs = compileTransforms(source, {"Joined":"17.05.2023"}, {"Joined":["joined"]})
+    assert programs["Joined"]["type"] == "date"
+    assert programs["Joined"]["source_format"] == "%Y-%m-%d"
+    assert programs["Joined"]["target_format"] == "%d.%m.%Y"
+    other = pd.DataFrame({"joined":["2021-12-31", "", "not a date"]})
+    assert applyTransforms(other, programs)["Joined"].tolist() == ["31.12.2021", "", "not a date"]
+
+def test_ambiguous_date_is_not_parsed():
+    assert parseDate("01/02/2023") == (None, None)
+    assert parseDate("13/02/2023")[1] == "%d/%m/%Y"
+    assert "Date" not in compileTransforms(getRow(date="01/02/2023"), {"Date":"2023-02-01"}, {"Date":["date"]})
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from src import args
+from src.utils import getLineageFromRow, isLowCardinality, getColumnGroups, getConstantColumns, \
+    isRebuiltFrom, getVerifiedLineage, getEmptySourceMask
+
+def test_lineage_from_row():
+    source_row_df = pd.DataFrame([{"first":"Ann", "last":"Lee", "copy":"Ann", "empty":None}])
+    lineage = getLineageFromRow(source_row_df, {"Name":"Ann", "Surname":" Lee ", "Age":"20", "Note":""})
+    assert lineage == {"Name":["first", "copy"], "Surname":["last"], "Age":[], "Note":[]}
+
+def test_low_cardinality():
+    rows = args.LOW_CARDINALITY_MAX_VALUES * 10
+    assert isLowCardinality(pd.Series(["active", "passive"] * (rows // 2)))
+    assert not isLowCardinality(pd.Series(range(rows)))
+    assert not isLowCardinality(pd.Series(np.arange(rows) % (args.LOW_CARDINALITY_MAX_VALUES + 1)))
+
+def test_column_groups():
+    df = pd.DataFrame({"a":[1, 2], "b":["x", "y"], "c":[1, 2], "d":["x", "y"], "e":[2, 1]})
+    kept, groups = getColumnGroups(df)
+    assert list(kept.columns) == ["a", "b", "e"]
+    assert groups == {"a":["a", "c"], "b":["b", "d"]}
+
+def test_constant_columns():
+    df = pd.DataFrame({"country":["TR", "TR", "TR"], "name":["a", "b", "c"], "empty":[None, None, None]})
+    assert getConstantColumns(df) == ["country", "empty"]
+    assert getConstantColumns(df.iloc[:1]) == []
+
+def test_rebuilt_from():
+    assert isRebuiltFrom("Gold", ["Gold Plan"])
+    assert isRebuiltFrom("17.05.2023", ["2023-05-17"])
+    assert not isRebuiltFrom("Ann Lee (20)", ["Ann"])
+    assert not isRebuiltFrom("", ["Ann"])
+
+def test_verified_lineage():
+    source_row_df = pd.DataFrame([{"first":"Ann", "age":"20", "plan":"Gold Plan"}])
+    target_row = {"Name":"Ann", "Label":"Ann (20)", "Plan":"Gold"}
+    lineage = {"Name":["first"], "Label":["first"], "Plan":["plan"]}
+    programs = {"Name":{"type":"affix", "column":"first", "case":"", "prefix":"", "suffix":""}}
+    assert getVerifiedLineage(source_row_df, target_row, lineage, programs) == {"Name":["first"], "Plan":["plan"]}
+
+def test_empty_source_mask():
+    source = pd.DataFrame({"first":["Ann", "", None], "last":["Lee", None, "Kim"]})
+    mask = getEmptySourceMask(source, {"Name":["first", "last"], "First":["first"], "Age":[]}, ["Name", "First", "Age"])
+    assert mask["Name"].tolist() == [False, True, False]
+    assert mask["First"].tolist() == [False, True, True]
+    # target columns without source columns are never masked
+    assert not mask["Age"].any()
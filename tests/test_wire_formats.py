@@ -0,0 +1,28 @@
+import pandas as pd
+from src.wire_formats import getWireFormat, MALFORMED
+
+TABLE = pd.DataFrame({"Name":["Ann Lee", "Bob, Jr"], "Plan":["Gold", ""]})
+COLUMNS = ["Name", "Plan"]
+
+def test_formats_read_their_own_output():
+    for name in ("json", "csv", "tsv", "jsonl", "indexed"):
+        wire_format = getWireFormat(name)
+        assert wire_format.parse(wire_format.dumpOutput(TABLE), COLUMNS) == {"Name":["Ann Lee", "Bob, Jr"], "Plan":["Gold", ""]}, name
+
+def test_json_is_found_in_prose():
+    assert getWireFormat("json").parse('Sure:\n{"Name": ["Ann"]}\nDone', ["Name"]) == {"Name":["Ann"]}
+    assert getWireFormat("json").parse("no table", ["Name"]) is None
+
+def test_csv_without_header_and_with_prose():
+    csv = getWireFormat("csv")
+    assert csv.parse("Ann,Gold\nBob,Silver", COLUMNS) == {"Name":["Ann", "Bob"], "Plan":["Gold", "Silver"]}
+    text = "Here is the table:\n```\nPlan,Name\nGold,Ann\n```"
+    assert csv.parse(text, COLUMNS) == {"Name":["Ann"], "Plan":["Gold"]}
+
+def test_malformed_rows():
+    res = getWireFormat("csv").parse("Name,Plan\nAnn,Gold\nBob\nCid,Silver", COLUMNS)
+    assert res["Name"] == ["Ann", MALFORMED, "Cid"]
+    res = getWireFormat("jsonl").parse('["Name", "Plan"]\n["Ann", "Gold"]\n["Bob", \n["Cid", "Silver"]', COLUMNS)
+    assert res["Plan"] == ["Gold", MALFORMED, "Silver"]
+    res = getWireFormat("indexed").parse('{"0": "Name", "1": "Plan"}\n{"0": "Ann"}\n{"0": "Cid", "1": "Silver"}', COLUMNS)
+    assert res["Plan"] == [MALFORMED, "Silver"]